@@ -0,0 +1,166 @@
+import argparse, json, os, sys, time, traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field, asdict
+from typing import Iterator, Optional
+
+from source.model.anim_source import ANIM_FILES
+from source.model.ganim_format import Animation
+from source.model.ganim_io import GriftAnimIO
+from source.model.image_format import write_image
+from source.model.texture_cache import DEFAULT_TEXTURE_CACHE
+
+@dataclass
+class BatchOptions:
+    output_root: str = ""
+    # Also export each material as an image of this extension (e.g. ".png")
+    export_images: Optional[str] = None
+    # Block compression ("DXT1" or "DXT5") and mip levels of exported .tex and .dds images
+    pixel_format: Optional[str] = None
+    mipmaps: bool = False
+    memory_map: bool = False
+
+@dataclass
+class ItemResult:
+    source: str = ""
+    output: str = ""
+    ok: bool = False
+    error: str = ""
+    elapsed: float = 0.0
+    num_symbols: int = 0
+    num_anims: int = 0
+    num_frames: int = 0
+
+@dataclass
+class BatchReport:
+    total: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    elapsed: float = 0.0
+    items: list[ItemResult] = field(default_factory=list)
+
+def is_animation_folder(path: str) -> bool:
+    return any(os.path.isfile(os.path.join(path, name)) for name in ANIM_FILES)
+
+# Find every animation folder and zip under root, in a stable order
+def find_animations(root: str) -> Iterator[str]:
+    if os.path.isfile(root):
+        if root.lower().endswith(".zip"):
+            yield root
+        return
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        if is_animation_folder(dirpath):
+            yield dirpath
+        for filename in sorted(filenames):
+            if filename.lower().endswith(".zip"):
+                yield os.path.join(dirpath, filename)
+
+def get_output_folder(source: str, input_root: str, output_root: str) -> str:
+    if os.path.isfile(input_root):
+        rel_path = os.path.basename(source)
+    else:
+        rel_path = os.path.relpath(source, input_root)
+    if rel_path.lower().endswith(".zip"):
+        rel_path = rel_path[:-len(".zip")]
+    return os.path.normpath(os.path.join(output_root, rel_path))
+
+def read_source(source: str, options: BatchOptions) -> Animation:
+    animation = GriftAnimIO.read_animation(source, options.memory_map)
+    if animation.build is None and animation.anim is None:
+        raise ValueError("No build.bin or anim.bin found")
+    return animation
+
+def export_material_images(animation: Animation, output_folder: str, options: BatchOptions) -> None:
+    if not animation.build or not options.export_images:
+        return
+    for material in animation.build.materials:
+        if material.image:
+            image_path = os.path.splitext(os.path.join(output_folder, material.path))[0] + options.export_images
+            write_image(image_path, material.image, pixel_format=options.pixel_format, mipmaps=options.mipmaps)
+
+# Convert one animation. Runs in a worker process, so every error is caught and reported
+def convert_item(source: str, output_folder: str, options: BatchOptions) -> ItemResult:
+    result = ItemResult(source, output_folder)
+    start = time.perf_counter()
+    try:
+        animation = read_source(source, options)
+        GriftAnimIO.write_animation(output_folder, animation)
+        if options.export_images:
+            export_material_images(animation, output_folder, options)
+        if animation.build:
+            result.num_symbols = len(animation.build.symbols)
+        if animation.anim:
+            result.num_anims = len(animation.anim.anims)
+            result.num_frames = sum(len(anim.frames) for anim in animation.anim.anims)
+        result.ok = True
+    except Exception as e:
+        result.error = "".join(traceback.format_exception_only(type(e), e)).strip()
+    # Every item reads different textures, so there is nothing to gain from keeping them
+    DEFAULT_TEXTURE_CACHE.clear()
+    result.elapsed = time.perf_counter() - start
+    return result
+
+def print_progress(done: int, total: int, result: ItemResult) -> None:
+    status = "ok" if result.ok else f"FAILED: {result.error}"
+    print(f"[{done}/{total}] {result.source} ({result.elapsed:.2f}s) {status}", file=sys.stderr)
+
+def run_batch(input_root: str, options: BatchOptions, jobs: Optional[int] = None, progress: bool = True) -> BatchReport:
+    start = time.perf_counter()
+    sources = list(find_animations(input_root))
+    report = BatchReport(total=len(sources))
+    tasks = [(source, get_output_folder(source, input_root, options.output_root)) for source in sources]
+
+    def record(result: ItemResult) -> None:
+        report.items.append(result)
+        if result.ok:
+            report.succeeded += 1
+        else:
+            report.failed += 1
+        if progress:
+            print_progress(len(report.items), report.total, result)
+
+    if jobs == 1:
+        for source, output_folder in tasks:
+            record(convert_item(source, output_folder, options))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {executor.submit(convert_item, source, output_folder, options): source for source, output_folder in tasks}
+            for future in as_completed(futures):
+                try:
+                    record(future.result())
+                except Exception as e:
+                    # The worker itself died (e.g. it was killed), so the item could not report back
+                    record(ItemResult(futures[future], error=f"{type(e).__name__}: {e}"))
+    report.items.sort(key=lambda item: item.source)
+    report.elapsed = time.perf_counter() - start
+    return report
+
+def print_summary(report: BatchReport) -> None:
+    print(f"Processed {report.total} animation(s) in {report.elapsed:.2f}s: {report.succeeded} succeeded, {report.failed} failed")
+    for item in report.items:
+        if not item.ok:
+            print(f"  {item.source}: {item.error}")
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Convert a tree of Griftlands animation folders or zips")
+    parser.add_argument("input", help="Animation folder, zip, or a folder containing them")
+    parser.add_argument("output", help="Folder to write the converted animations to")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Number of worker processes (default: number of CPUs)")
+    parser.add_argument("--export-images", choices=["png", "dds", "tex"], help="Also export every material as an image of this format")
+    parser.add_argument("--pixel-format", choices=["DXT1", "DXT5"], help="Block-compress exported .tex and .dds images")
+    parser.add_argument("--mipmaps", action="store_true", help="Add mip levels to exported .tex and .dds images")
+    parser.add_argument("--memory-map", action="store_true", help="Memory-map build.bin and anim.bin while reading")
+    parser.add_argument("--report", help="Write a JSON report of every item to this file")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Don't print progress")
+    args = parser.parse_args(argv)
+
+    options = BatchOptions(args.output, args.export_images and "." + args.export_images, args.pixel_format, args.mipmaps, args.memory_map)
+    report = run_batch(args.input, options, args.jobs, not args.quiet)
+    print_summary(report)
+    if args.report:
+        with open(args.report, "w") as report_file:
+            json.dump(asdict(report), report_file, indent=2)
+    return 1 if report.failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,236 @@
+import argparse, io, json, os, sys, tempfile, time, tracemalloc
+from dataclasses import dataclass, field, asdict
+from typing import Any, Callable, Optional
+
+from source.model.ganim_format import *
+from source.model.ganim_io import GriftAnimIO, BUILD_STRING, ANIM_STRING
+from source.model.ganim_columnar import ColumnarAnimFile
+from source.model.ganim_lazy import LazyAnimFile
+from source.model.ganim_synthetic import SyntheticScale, make_build_file, make_anim_file
+from source.model.file_io import BufferReader
+
+# Data shared by every codec path of one benchmark run
+@dataclass
+class BenchContext:
+    build: BuildFile
+    anim: AnimFile
+    build_bytes: bytes
+    anim_bytes: bytes
+    folder: str
+
+    @property
+    def build_path(self) -> str:
+        return os.path.join(self.folder, "build.bin")
+
+    @property
+    def anim_path(self) -> str:
+        return os.path.join(self.folder, "anim.bin")
+
+@dataclass
+class CodecPath:
+    name: str
+    # "build" or "anim"
+    target: str
+    # "read" or "write"
+    op: str
+    run: Callable[[BenchContext], Any]
+    # Bytes produced by the result, compared with the reference bytes of the target
+    encode: Callable[[Any], bytes]
+    # Number of objects the path handles, for objects/s
+    count: Callable[[BenchContext], int]
+
+@dataclass
+class BenchResult:
+    name: str = ""
+    target: str = ""
+    op: str = ""
+    size: int = 0
+    objects: int = 0
+    best_time: float = 0.0
+    mean_time: float = 0.0
+    mb_per_s: float = 0.0
+    objects_per_s: float = 0.0
+    peak_memory: int = 0
+    round_trip: bool = False
+
+@dataclass
+class BenchReport:
+    scale: SyntheticScale = field(default_factory=SyntheticScale)
+    seed: int = 0
+    repeat: int = 0
+    results: list[BenchResult] = field(default_factory=list)
+
+### Reference writers using the per-field methods, to check the other paths against
+
+def reference_encode_build(build: BuildFile) -> bytes:
+    file = io.BytesIO()
+    GriftAnimIO.write_str(file, BUILD_STRING, False)
+    GriftAnimIO.write_int(file, BUILD_VERSION)
+    GriftAnimIO.write_int(file, len(build.symbols))
+    GriftAnimIO.write_int(file, build.total_frames)
+    GriftAnimIO.write_str(file, build.build_name)
+    GriftAnimIO.write_int(file, len(build.materials))
+    for material in build.materials:
+        GriftAnimIO.write_str(file, material.path)
+    GriftAnimIO.write_int(file, len(build.sdf_materials))
+    for sdf_material in build.sdf_materials:
+        GriftAnimIO.write_str(file, sdf_material)
+    for symbol in build.symbols:
+        GriftAnimIO.write_build_symbol(file, symbol)
+    GriftAnimIO.write_int(file, len(build.hashed_strings))
+    for hash_val, hash_str in build.hashed_strings.items():
+        GriftAnimIO.write_int(file, hash_val)
+        GriftAnimIO.write_str(file, hash_str)
+    return file.getvalue()
+
+def reference_encode_anim(anim: AnimFile) -> bytes:
+    file = io.BytesIO()
+    GriftAnimIO.write_str(file, ANIM_STRING, False)
+    GriftAnimIO.write_int(file, ANIM_VERSION)
+    GriftAnimIO.write_int(file, anim.num_element_refs)
+    GriftAnimIO.write_int(file, anim.num_frames)
+    GriftAnimIO.write_int(file, len(anim.anims))
+    for one_anim in anim.anims:
+        GriftAnimIO.write_anim_data(file, one_anim)
+    GriftAnimIO.write_int(file, len(anim.hashed_strings))
+    for hash_val, hash_str in anim.hashed_strings.items():
+        GriftAnimIO.write_int(file, hash_val)
+        GriftAnimIO.write_str(file, hash_str)
+    return file.getvalue()
+
+def count_build_objects(context: BenchContext) -> int:
+    return len(context.build.symbols) + sum(len(symbol.frames) for symbol in context.build.symbols)
+
+def count_anim_objects(context: BenchContext) -> int:
+    anims = context.anim.anims
+    return len(anims) + sum(len(anim.frames) + sum(len(frame.elements) for frame in anim.frames) for anim in anims)
+
+def count_anim_frames(context: BenchContext) -> int:
+    return sum(len(anim.frames) for anim in context.anim.anims)
+
+def read_mmap_build(context: BenchContext) -> BuildFile:
+    with GriftAnimIO.map_file(context.build_path) as reader:
+        return GriftAnimIO.parse_build_file(reader, context.folder, True)
+
+def read_mmap_anim(context: BenchContext) -> AnimFile:
+    with GriftAnimIO.map_file(context.anim_path) as reader:
+        return GriftAnimIO.parse_anim_file(reader)
+
+def read_lazy_index(context: BenchContext) -> LazyAnimFile:
+    lazy = LazyAnimFile(context.anim_bytes)
+    lazy.close()
+    return lazy
+
+def encode_lazy_index(lazy: LazyAnimFile) -> bytes:
+    # Only the index is built, so check that it covers every anim
+    return b"".join(entry.anim_name.encode() for entry in lazy.entries)
+
+def encode_columnar(columnar: ColumnarAnimFile) -> bytes:
+    file = io.BytesIO()
+    columnar.write(file)
+    return file.getvalue()
+
+def get_codec_paths() -> list[CodecPath]:
+    encode_build = GriftAnimIO.encode_build_file
+    encode_anim = GriftAnimIO.encode_anim_file
+    identity: Callable[[Any], bytes] = lambda data: data
+    return [
+        CodecPath("stream", "build", "read", lambda c: GriftAnimIO.read_build_file(io.BytesIO(c.build_bytes), c.folder, True), encode_build, count_build_objects),
+        CodecPath("buffer", "build", "read", lambda c: GriftAnimIO.parse_build_file(BufferReader(c.build_bytes), c.folder, True), encode_build, count_build_objects),
+        CodecPath("mmap", "build", "read", read_mmap_build, encode_build, count_build_objects),
+        CodecPath("per_field", "build", "write", lambda c: reference_encode_build(c.build), identity, count_build_objects),
+        CodecPath("buffered", "build", "write", lambda c: GriftAnimIO.encode_build_file(c.build), identity, count_build_objects),
+
+        CodecPath("stream", "anim", "read", lambda c: GriftAnimIO.read_anim_file(io.BytesIO(c.anim_bytes)), encode_anim, count_anim_objects),
+        CodecPath("buffer", "anim", "read", lambda c: GriftAnimIO.parse_anim_file(BufferReader(c.anim_bytes)), encode_anim, count_anim_objects),
+        CodecPath("mmap", "anim", "read", read_mmap_anim, encode_anim, count_anim_objects),
+        CodecPath("columnar", "anim", "read", lambda c: ColumnarAnimFile.read(io.BytesIO(c.anim_bytes)), encode_columnar, count_anim_objects),
+        CodecPath("lazy_index", "anim", "read", read_lazy_index, encode_lazy_index, count_anim_frames),
+        CodecPath("per_field", "anim", "write", lambda c: reference_encode_anim(c.anim), identity, count_anim_objects),
+        CodecPath("buffered", "anim", "write", lambda c: GriftAnimIO.encode_anim_file(c.anim), identity, count_anim_objects),
+        CodecPath("columnar", "anim", "write", lambda c: encode_columnar(ColumnarAnimFile.from_anim_file(c.anim)), identity, count_anim_objects),
+    ]
+
+def check_round_trip(path: CodecPath, context: BenchContext, result: Any) -> bool:
+    if path.name == "lazy_index":
+        return path.encode(result) == b"".join(anim.anim_name.encode() for anim in context.anim.anims)
+    expected = context.build_bytes if path.target == "build" else context.anim_bytes
+    return path.encode(result) == expected
+
+def measure_peak_memory(path: CodecPath, context: BenchContext) -> int:
+    tracemalloc.start()
+    try:
+        path.run(context)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def run_path(path: CodecPath, context: BenchContext, repeat: int) -> BenchResult:
+    result = BenchResult(path.name, path.target, path.op)
+    result.size = len(context.build_bytes if path.target == "build" else context.anim_bytes)
+    result.objects = path.count(context)
+    times: list[float] = []
+    output: Any = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = path.run(context)
+        times.append(time.perf_counter() - start)
+    result.round_trip = check_round_trip(path, context, output)
+    result.best_time = min(times)
+    result.mean_time = sum(times) / len(times)
+    if result.best_time > 0:
+        result.mb_per_s = result.size / result.best_time / 1e6
+        result.objects_per_s = result.objects / result.best_time
+    result.peak_memory = measure_peak_memory(path, context)
+    return result
+
+def run_benchmark(scale: SyntheticScale, seed: int = 0, repeat: int = 5, only: Optional[list[str]] = None) -> BenchReport:
+    report = BenchReport(scale, seed, repeat)
+    build = make_build_file(scale, seed)
+    anim = make_anim_file(scale, seed)
+    with tempfile.TemporaryDirectory() as folder:
+        context = BenchContext(build, anim, reference_encode_build(build), reference_encode_anim(anim), folder)
+        with open(context.build_path, "wb") as build_file:
+            build_file.write(context.build_bytes)
+        with open(context.anim_path, "wb") as anim_file:
+            anim_file.write(context.anim_bytes)
+        for path in get_codec_paths():
+            if only and f"{path.target}/{path.op}/{path.name}" not in only and path.name not in only:
+                continue
+            report.results.append(run_path(path, context, repeat))
+    return report
+
+def print_report(report: BenchReport) -> None:
+    print(f"Scale: {report.scale}, seed {report.seed}, best of {report.repeat}")
+    print(f"{'path':<26}{'size':>12}{'best (ms)':>12}{'MB/s':>10}{'objects/s':>14}{'peak mem':>12}  round trip")
+    for result in report.results:
+        name = f"{result.target}/{result.op}/{result.name}"
+        print(f"{name:<26}{result.size:>12}{result.best_time * 1000:>12.2f}{result.mb_per_s:>10.1f}{result.objects_per_s:>14.0f}{result.peak_memory:>12}  {'ok' if result.round_trip else 'MISMATCH'}")
+
+def main(argv: Optional[list[str]] = None) -> int:
+    default = SyntheticScale()
+    parser = argparse.ArgumentParser(description="Benchmark reading and writing of build.bin and anim.bin on synthetic data")
+    parser.add_argument("--symbols", type=int, default=default.num_symbols)
+    parser.add_argument("--frames-per-symbol", type=int, default=default.frames_per_symbol)
+    parser.add_argument("--materials", type=int, default=default.num_materials)
+    parser.add_argument("--anims", type=int, default=default.num_anims)
+    parser.add_argument("--frames-per-anim", type=int, default=default.frames_per_anim)
+    parser.add_argument("--elements", type=int, default=default.elements_per_frame, help="Elements per anim frame")
+    parser.add_argument("--hashed-strings", type=int, default=default.num_hashed_strings)
+    parser.add_argument("--string-length", type=int, default=default.hashed_string_length)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", nargs="*", help="Only run these paths (e.g. anim/read/columnar, or just columnar)")
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args(argv)
+
+    scale = SyntheticScale(args.symbols, args.frames_per_symbol, args.materials, args.anims, args.frames_per_anim, args.elements, args.hashed_strings, args.string_length)
+    report = run_benchmark(scale, args.seed, args.repeat, args.only)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump(asdict(report), json_file, indent=2)
+    return 0 if all(result.round_trip for result in report.results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,38 @@
+import argparse, sys, time
+from typing import Optional
+
+from source.model.frame_export import export_frames, FrameExportOptions, LAYOUTS
+from source.model.ganim_io import GriftAnimIO
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Render the frames of Griftlands animations to PNG sequences or sprite sheets")
+    parser.add_argument("input", help="Animation folder or zip (with build.bin and anim.bin)")
+    parser.add_argument("output", help="Folder to write the images to")
+    parser.add_argument("--anim", action="append", help="Name of an anim to render (can be repeated, default: every anim)")
+    parser.add_argument("--layout", choices=LAYOUTS, default="sequence", help="One image per frame, or one sprite sheet per anim")
+    parser.add_argument("--scale", type=float, default=1.0, help="Pixels per unit of anim space")
+    parser.add_argument("--max-size", type=int, help="Fit every frame in this many pixels instead")
+    parser.add_argument("--columns", type=int, help="Columns of sprite sheets")
+    parser.add_argument("--padding", type=int, default=0, help="Pixels between the frames of sprite sheets")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Number of worker processes (default: number of CPUs)")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    animation = GriftAnimIO.read_animation(args.input)
+    if animation.build is None or animation.anim is None:
+        print(f"{args.input} needs both build.bin and anim.bin", file=sys.stderr)
+        return 1
+    anims = animation.anim.anims
+    if args.anim:
+        anims = [anim for anim in anims if anim.anim_name in args.anim]
+        missing = set(args.anim) - {anim.anim_name for anim in anims}
+        if missing:
+            print(f"Anims not found: {', '.join(sorted(missing))}", file=sys.stderr)
+            return 1
+    options = FrameExportOptions(args.layout, args.scale, args.max_size, args.columns, args.padding)
+    files = export_frames(animation.build, anims, args.output, options, args.jobs)
+    print(f"Rendered {sum(len(anim.frames) for anim in anims)} frame(s) of {len(anims)} anim(s) to {len(files)} file(s) in {time.perf_counter() - start:.2f}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
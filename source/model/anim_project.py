@@ -1,9 +1,10 @@
 from dataclasses import dataclass, field
 from PIL import Image
-from typing import Optional, TypeVar, Protocol, Generator, Any, runtime_checkable
-import os, weakref
+from typing import Optional, TypeVar, Protocol, Generator, Any, Callable, TextIO, runtime_checkable
+import os, threading, traceback, weakref
 
-from source.model.image_format import read_image
+from source.model.texture_cache import read_cached_image
+from source.model.file_util import iter_json_members
 
 @dataclass
 class HasUID:
@@ -48,6 +49,16 @@ class UIDJsonSavable(Protocol):
 
 U = TypeVar("U", bound=HasUID)
 
+# An asset that is still the same as a file on disk, so saving it only needs a copy of the file (or nothing)
+# image is the decoded image, if it was loaded
+@dataclass
+class AssetFile:
+    path: str
+    image: Optional[Image.Image] = None
+
+def is_same_file(path: str, other: str) -> bool:
+    return os.path.normcase(os.path.abspath(path)) == os.path.normcase(os.path.abspath(other))
+
 @dataclass
 class IntCoord:
     x: int = 0
@@ -135,7 +146,8 @@ class AtlasParent:
 @dataclass
 class Atlas(HasUID):
     parent_info: AtlasParent = field(default_factory=AtlasParent)
-    source: Optional[Image.Image] = None
+    # The image of the atlas, see source
+    _source: Optional[Image.Image] = None
     # Dict of images based on uid
     images: dict[int, AtlasImage] = field(default_factory=dict)
     children: dict[int, 'Atlas'] = field(default_factory=dict)
@@ -143,11 +155,62 @@ class Atlas(HasUID):
     size: IntCoord = field(default_factory=IntCoord)
     # Name for the atlas
     name: str = ""
+    # File that source is the same as, if any. source is read from it when first accessed
+    _source_path: Optional[str] = field(default=None, compare=False, repr=False)
+    # Whether source was edited in place since it was read or saved, so it has to be encoded again
+    # Assigning a different image to source is detected without this
+    # A source read from a file is shared with the texture cache, so it must not be edited in place. Assign an edited copy instead
+    _source_dirty: bool = field(default=False, compare=False, repr=False)
+    _source_lock: threading.Lock = field(default_factory=threading.Lock, compare=False, repr=False)
+
+    @property
+    def source(self) -> Optional[Image.Image]:
+        if self._source is None and self._source_path is not None:
+            # Another thread (see AnimProject.preload_sources) may be reading it already
+            with self._source_lock:
+                if self._source is None and self._source_path is not None:
+                    self._source = read_cached_image(self._source_path, copy=False)
+        return self._source
+
+    @source.setter
+    def source(self, value: Optional[Image.Image]) -> None:
+        with self._source_lock:
+            self._source = value
+            self._source_path = None
+
+    @property
+    def source_loaded(self) -> bool:
+        return self._source is not None
+
+    def has_source(self) -> bool:
+        return self._source is not None or self._source_path is not None
+
+    # Make source read from path when first accessed
+    def set_source_path(self, path: Optional[str]) -> None:
+        with self._source_lock:
+            self._source_path = path
+            if path is None:
+                return
+            if self._source_dirty:
+                # The loaded image has edits, so it isn't the same as the file
+                self._source = None
+
+    @property
+    def source_dirty(self) -> bool:
+        return self._source_dirty
+
+    def mark_source_dirty(self, dirty: Optional[bool] = None) -> None:
+        if dirty is None:
+            dirty = True
+        self._source_dirty = dirty
+        if dirty and self._project is not None:
+            self._project.mark_dirty()
 
     def add_image(self, image: AtlasImage) -> AtlasImage:
         if self._project is None:
             raise ValueError("Field _project is None")
-        if image.atlas is not None and image.atlas != self:
+        atlas = image.atlas and image.atlas()
+        if atlas is not None and atlas is not self:
             raise ValueError("Image already assigned to an atlas")
         self._project.register_object(image)
         obj_id = image.get_uid()
@@ -161,7 +224,8 @@ class Atlas(HasUID):
         parent = self.parent_info.parent
         parent = parent and parent()
         if parent is not None:
-            del parent.children[self.get_uid()]
+            # While loading, a child can name its parent before the parent adds it
+            parent.children.pop(self.get_uid(), None)
 
     def add_child(self, atlas: 'Atlas') -> 'Atlas':
         if self._project is None:
@@ -194,11 +258,18 @@ class Atlas(HasUID):
             "images": [project.save_json_tracker(uid, obj_dict, asset_dict) for uid in self.images],
             "children": [project.save_json_tracker(uid, obj_dict, asset_dict) for uid in self.children]
         }
-        if self.source:
+        self.add_asset(asset_dict)
+        return result
+
+    # Add the source to the assets to save, as an AssetFile if it is still the same as its file
+    def add_asset(self, asset_dict: dict[str, Any]) -> None:
+        if self.has_source():
             if self.name in asset_dict:
                 raise ValueError(f"Image named '{self.name}' appears multiple times")
-            asset_dict[self.name] = self.source
-        return result
+            if self._source_path is not None and not self._source_dirty:
+                asset_dict[self.name] = AssetFile(self._source_path, self._source)
+            else:
+                asset_dict[self.name] = self.source
 
     def load_json(self, project: 'AnimProject', obj: Any, asset_path: str) -> None:
         if obj is None:
@@ -209,14 +280,52 @@ class Atlas(HasUID):
         for image in obj.get("images", []):
             self.add_image(project.load_json_ref_object(image, AtlasImage))
         for child in obj.get("children", []):
-            self.add_child(project.load_json_ref_object(child, Atlas))
+            child_atlas = project.load_json_ref_object(child, Atlas)
+            # Keep the position of children that were loaded first
+            pos = child_atlas.parent_info.pos
+            self.add_child(child_atlas)
+            child_atlas.parent_info.pos = pos
         if self.name:
             image_path = os.path.join(asset_path, self.name)
             if os.path.isfile(image_path):
-                self.source = read_image(image_path)
+                self.set_source_path(image_path)
 
 LATEST_PROJECT_VERSION = 1
 
+# Functions that upgrade project JSON from a version to the next one, by the version they upgrade from
+PROJECT_UPGRADES: dict[int, Callable[[Any], Any]] = {}
+
+def check_project_version(version: int) -> None:
+    if version < 1:
+        raise ValueError(f"Bad version number ({version})")
+    if version > LATEST_PROJECT_VERSION:
+        raise ValueError(f"Project version {version} is newer than the latest supported version ({LATEST_PROJECT_VERSION})")
+
+def upgrade_project_json(obj: Any) -> Any:
+    version = obj.get("_version", 0)
+    check_project_version(version)
+    while version < LATEST_PROJECT_VERSION:
+        obj = PROJECT_UPGRADES[version](obj)
+        version += 1
+        obj["_version"] = version
+    return obj
+
+# Objects created while loading a project, kept alive until the project holds them
+# An object referenced before it is loaded is created empty (a forward declaration) and filled in once it is loaded
+@dataclass
+class ProjectLoadState:
+    objects: list[HasUID] = field(default_factory=list)
+    # Forward declarations that weren't loaded yet, by uid
+    unresolved: dict[int, HasUID] = field(default_factory=dict)
+
+    def forward_declare(self, project: 'AnimProject', uid: int, obj_type: type) -> HasUID:
+        obj = obj_type()
+        obj._uid = uid
+        project.register_object(obj)
+        self.objects.append(obj)
+        self.unresolved[uid] = obj
+        return obj
+
 @dataclass
 class AnimProject:
     # Dict of atlases based on uid
@@ -225,6 +334,8 @@ class AnimProject:
 
     _current_uid: int = 0
     _dirty: bool = False
+    # Set while the project is being loaded
+    _load_state: Optional['ProjectLoadState'] = field(default=None, compare=False, repr=False)
 
     @property
     def dirty(self): return self._dirty
@@ -283,33 +394,123 @@ class AnimProject:
 
         return proj, asset_dict
 
+    # Assets that have to be written to asset_path. Assets that are still the same as their file there are left out
+    def get_changed_assets(self, asset_path: str, asset_dict: dict[str, Any]) -> dict[str, Any]:
+        changed: dict[str, Any] = {}
+        for name, asset in asset_dict.items():
+            if isinstance(asset, AssetFile) and is_same_file(asset.path, os.path.join(asset_path, name)) and os.path.isfile(asset.path):
+                continue
+            changed[name] = asset
+        return changed
+
+    # Record that the project was saved with its assets in asset_path
+    # From now on, atlas sources are the same as their files there, until they are edited or replaced
+    def mark_saved(self, asset_path: str) -> None:
+        for obj in list(self.objects_by_uid.values()):
+            if isinstance(obj, Atlas) and obj.name and obj.has_source():
+                obj.mark_source_dirty(False)
+                obj.set_source_path(os.path.join(asset_path, obj.name))
+        self.mark_dirty(False)
+
+    def get_atlases(self) -> list[Atlas]:
+        return [obj for obj in self.objects_by_uid.values() if isinstance(obj, Atlas)]
+
+    # Read every atlas source on a background thread, so they are ready when first used
+    def preload_sources(self) -> threading.Thread:
+        def preload(atlases: list[Atlas]) -> None:
+            for atlas in atlases:
+                try:
+                    atlas.source
+                except Exception as e:
+                    # Reported again when the source is used
+                    traceback.print_exception(e)
+        thread = threading.Thread(target=preload, args=(self.get_atlases(),), name="preload_sources", daemon=True)
+        thread.start()
+        return thread
+
     def load_json_ref_object(self, obj: Any, obj_type: type) -> Any:
         if obj["_type"] != "_Reference":
             raise ValueError("Object not a reference")
-        ref_obj = self.objects_by_uid[obj["uid_ref"]]
+        uid = obj["uid_ref"]
+        ref_obj = self.objects_by_uid.get(uid)
+        if ref_obj is None and self._load_state is not None:
+            ref_obj = self._load_state.forward_declare(self, uid, obj_type)
+        elif ref_obj is None:
+            raise KeyError(uid)
         if not isinstance(ref_obj, obj_type):
             raise ValueError(f"Invalid type: Expected {obj_type}, got {ref_obj.__class__}")
         return ref_obj
 
-    def load_json(self, obj: Any, asset_path: str) -> None:
-        if obj.get("_version", 0) < 1:
-            raise ValueError(f"Bad version number ({obj.get('_version', 0)})")
-        loaded_objects: list[UIDJsonSavable] = []
-        # Create the objects, but don't populate the save data just yet, since references might not be created
-        for one_obj in obj["objects"]:
-            obj_class = globals().get(one_obj["_type"])
-            if not callable(obj_class):
-                raise ValueError(f"Incorrect type: {one_obj['_type']}")
+    # Create (or fill in, if it was referenced already) the object saved in obj, with the uid it was saved with
+    def load_json_object(self, obj: Any, asset_path: str) -> HasUID:
+        if self._load_state is None:
+            raise ValueError("Project is not being loaded")
+        obj_class = globals().get(obj["_type"])
+        if not callable(obj_class):
+            raise ValueError(f"Incorrect type: {obj['_type']}")
+        uid = obj.get("_uid", 0)
+        created_obj = self._load_state.unresolved.pop(uid, None)
+        if created_obj is None:
             created_obj = obj_class()
             if not isinstance(created_obj, UIDJsonSavable) or not isinstance(created_obj, HasUID):
                 raise ValueError(f"Invalid type")
-            loaded_objects.append(self.register_object(created_obj, created_obj.get_uid()))
-        # Load anim project
-        self._current_uid = obj.get("_current_uid", max(self.objects_by_uid.keys(), default=0))
-        self.atlas = self.load_json_ref_object(obj["atlas"], Atlas)
-        # Do processing of each object created this way
-        for loaded_obj, json_obj in zip(loaded_objects, obj["objects"]):
-            loaded_obj.load_json(self, json_obj, asset_path)
+            created_obj._uid = uid
+            self.register_object(created_obj)
+            self._load_state.objects.append(created_obj)
+        elif created_obj.__class__ != obj_class:
+            raise ValueError(f"Invalid type: Expected {created_obj.__class__}, got {obj_class}")
+        created_obj.load_json(self, obj, asset_path)
+        return created_obj
+
+    def begin_load(self) -> None:
+        self._load_state = ProjectLoadState()
+
+    def end_load(self, atlas_ref: Any, current_uid: Optional[int]) -> None:
+        state = self._load_state
+        if state is None:
+            raise ValueError("Project is not being loaded")
+        self.atlas = self.load_json_ref_object(atlas_ref, Atlas)
+        self._load_state = None
+        if state.unresolved:
+            raise ValueError(f"Referenced objects missing from the project: {sorted(state.unresolved)}")
+        self._current_uid = max(current_uid or 0, max(self.objects_by_uid.keys(), default=0))
+
+    # Objects are loaded in a single pass. References to objects that come later in the list are resolved with ProjectLoadState
+    def load_json(self, obj: Any, asset_path: str) -> None:
+        obj = upgrade_project_json(obj)
+        self.begin_load()
+        try:
+            for one_obj in obj["objects"]:
+                self.load_json_object(one_obj, asset_path)
+            self.end_load(obj["atlas"], obj.get("_current_uid"))
+        finally:
+            self._load_state = None
+
+    # Load a project from a JSON file without reading all of it in memory first: objects are created as they are read
+    # Projects from older versions have to be upgraded as a whole, so they are read in full and passed to load_json
+    def load_json_stream(self, file: TextIO, asset_path: str) -> None:
+        header: dict[str, Any] = {}
+        old_objects: Optional[list[Any]] = None
+        self.begin_load()
+        try:
+            for key, value in iter_json_members(file, ("objects",)):
+                if key != "objects":
+                    header[key] = value
+                elif old_objects is not None:
+                    old_objects.append(value)
+                elif header.get("_version") == LATEST_PROJECT_VERSION:
+                    self.load_json_object(value, asset_path)
+                elif not self._load_state.objects:
+                    old_objects = [value]
+                else:
+                    raise ValueError("Project version must come before its objects")
+            if old_objects is None and header.get("_version") == LATEST_PROJECT_VERSION:
+                self.end_load(header["atlas"], header.get("_current_uid"))
+                return
+        finally:
+            self._load_state = None
+        header["objects"] = old_objects or []
+        self.load_json(header, asset_path)
 
 # Get a project for testing
 def get_test_project():
@@ -0,0 +1,147 @@
+from struct import Struct
+from typing import Any, Callable
+import os
+
+from source.model.anim_project import *
+from source.model.file_io import BufferReader, BufferWriter, WrongFormatException
+
+# Compact binary project files. Like the animation files, values are little endian
+# The file has a header, a table of every string, then one array of fixed-size records per object type
+# Records refer to strings by index and to other objects by uid (0 for none)
+# Atlases are stored parents first, and images and children in the order their atlas holds them
+
+PROJECT_BINARY_MAGIC = b"GAPJ"
+PROJECT_BINARY_VERSION = 1
+PROJECT_BINARY_EXTENSION = ".gaproj"
+
+# Magic, format version, project version, current uid, uid of the root atlas
+PROJECT_HEADER_STRUCT = Struct("<4s4I")
+INT_STRUCT = Struct("<I")
+# uid, name, parent atlas uid, position within the parent, size
+ATLAS_RECORD_STRUCT = Struct("<3I4i")
+# uid, name, atlas uid, position within the atlas, size
+ATLAS_IMAGE_RECORD_STRUCT = Struct("<3I4i")
+
+ENCODING = "utf-8"
+
+class StringTable:
+    def __init__(self) -> None:
+        self.strings: list[str] = []
+        self.indices: dict[str, int] = {}
+
+    def add(self, string: str) -> int:
+        index = self.indices.get(string)
+        if index is None:
+            index = self.indices[string] = len(self.strings)
+            self.strings.append(string)
+        return index
+
+    # The lengths of every string, followed by all of them
+    def pack(self, writer: BufferWriter) -> None:
+        encoded = [string.encode(ENCODING) for string in self.strings]
+        writer.pack(INT_STRUCT, len(encoded))
+        writer.pack(Struct(f"<{len(encoded)}I"), *map(len, encoded))
+        writer.write(b"".join(encoded))
+
+    @staticmethod
+    def parse(reader: BufferReader) -> list[str]:
+        count, = reader.unpack(INT_STRUCT)
+        lengths = reader.unpack(Struct(f"<{count}I"))
+        strings = []
+        for length in lengths:
+            strings.append(reader.read_str(length, ENCODING))
+        return strings
+
+def get_parent_uid(atlas: Atlas) -> int:
+    parent = atlas.parent_info.parent and atlas.parent_info.parent()
+    return parent.get_uid() if parent else 0
+
+# Every atlas reachable from root, parents first
+def collect_atlases(root: Atlas) -> list[Atlas]:
+    result: list[Atlas] = []
+    stack = [root]
+    while stack:
+        atlas = stack.pop()
+        result.append(atlas)
+        stack.extend(reversed(list(atlas.children.values())))
+    return result
+
+# Serialize the project to bytes. Also returns the assets to save, like AnimProject.save_json
+def encode_project(project: AnimProject) -> tuple[bytes, dict[str, Any]]:
+    strings = StringTable()
+    asset_dict: dict[str, Any] = {}
+    atlas_records: list[tuple[Any, ...]] = []
+    image_records: list[tuple[Any, ...]] = []
+    for atlas in collect_atlases(project.atlas):
+        pos = atlas.parent_info.pos
+        atlas_records.append((atlas.get_uid(), strings.add(atlas.name), get_parent_uid(atlas), pos.x, pos.y, atlas.size.x, atlas.size.y))
+        for image in atlas.images.values():
+            image_records.append((image.get_uid(), strings.add(image.name), atlas.get_uid(), image.pos.x, image.pos.y, image.size.x, image.size.y))
+        atlas.add_asset(asset_dict)
+
+    writer = BufferWriter()
+    writer.pack(PROJECT_HEADER_STRUCT, PROJECT_BINARY_MAGIC, PROJECT_BINARY_VERSION, LATEST_PROJECT_VERSION, project._current_uid, project.atlas.get_uid())
+    strings.pack(writer)
+    writer.pack(INT_STRUCT, len(atlas_records))
+    writer.pack_records(ATLAS_RECORD_STRUCT, atlas_records)
+    writer.pack(INT_STRUCT, len(image_records))
+    writer.pack_records(ATLAS_IMAGE_RECORD_STRUCT, image_records)
+    return writer.getvalue(), asset_dict
+
+# Objects get the uid they were saved with, so references between them stay the same
+# They are registered once, by whatever they are added to
+def with_uid(obj: U, uid: int) -> U:
+    obj._uid = uid
+    return obj
+
+def build_project(current_uid: int, root_uid: int, strings: list[str], atlas_records: list[tuple[Any, ...]], image_records: list[tuple[Any, ...]], asset_path: str) -> AnimProject:
+    project = AnimProject()
+    atlases: dict[int, Atlas] = {}
+    for uid, name, parent_uid, x, y, width, height in atlas_records:
+        atlas = with_uid(Atlas(name=strings[name], size=IntCoord(width, height)), uid)
+        if parent_uid:
+            atlases[parent_uid].add_child(atlas)
+        else:
+            project.register_object(atlas)
+        atlas.parent_info.pos = IntCoord(x, y)
+        atlases[uid] = atlas
+        if atlas.name:
+            image_path = os.path.join(asset_path, atlas.name)
+            if os.path.isfile(image_path):
+                atlas.set_source_path(image_path)
+    for uid, name, atlas_uid, x, y, width, height in image_records:
+        image = with_uid(AtlasImage(pos=IntCoord(x, y), size=IntCoord(width, height), name=strings[name]), uid)
+        atlases[atlas_uid].add_image(image)
+    project.atlas = atlases[root_uid]
+    project._current_uid = max(current_uid, max(project.objects_by_uid.keys(), default=0))
+    return project
+
+def parse_project_v1(reader: BufferReader, project_version: int, current_uid: int, root_uid: int, asset_path: str) -> AnimProject:
+    strings = StringTable.parse(reader)
+    count, = reader.unpack(INT_STRUCT)
+    atlas_records = reader.unpack_records(ATLAS_RECORD_STRUCT, count, tuple)
+    count, = reader.unpack(INT_STRUCT)
+    image_records = reader.unpack_records(ATLAS_IMAGE_RECORD_STRUCT, count, tuple)
+    return build_project(current_uid, root_uid, strings, atlas_records, image_records, asset_path)
+
+# Readers for each version of the binary format
+# Binary files are only written at the latest project version, which is still 1, so none of them need upgrading yet
+PROJECT_PARSERS: dict[int, Callable[[BufferReader, int, int, int, str], AnimProject]] = {
+    1: parse_project_v1,
+}
+
+def decode_project(data: bytes, asset_path: str) -> AnimProject:
+    with BufferReader(data) as reader:
+        magic, format_version, project_version, current_uid, root_uid = reader.unpack(PROJECT_HEADER_STRUCT)
+        if magic != PROJECT_BINARY_MAGIC:
+            raise WrongFormatException(f"Header must be {PROJECT_BINARY_MAGIC!r}")
+        if format_version not in PROJECT_PARSERS:
+            raise WrongFormatException(f"Unsupported project file version ({format_version})")
+        check_project_version(project_version)
+        project = PROJECT_PARSERS[format_version](reader, project_version, current_uid, root_uid, asset_path)
+        if not reader.at_end():
+            raise WrongFormatException(f"Unexpected data after the end of the project ({reader.remaining()} bytes)")
+        return project
+
+def is_binary_project_path(file: str) -> bool:
+    return os.path.splitext(file)[1].lower() == PROJECT_BINARY_EXTENSION
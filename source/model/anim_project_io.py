@@ -1,28 +1,64 @@
 from PIL import Image
+from typing import Optional
 import json, os
 
-from source.model.anim_project import AnimProject
+from source.model.anim_project import AnimProject, AssetFile
+from source.model.anim_project_binary import encode_project, decode_project, is_binary_project_path
 from source.model.ganim_format import Animation
-from source.model.image_format import write_image
+from source.model.image_export import ImageExporter
+from source.model.file_util import write_file_atomic
+from source.model.texture_cache import read_cached_image
 
-def save_project(file: str, project: AnimProject) -> None:
-    proj_json, asset_dict = project.save_json()
-    with open(file, "w") as proj_file:
-        json.dump(proj_json, proj_file)
+# Assets are encoded on a pool of threads, and the project file is only written once all of them succeeded
+# Unless incremental is turned off, only the assets that changed since the project was last saved or loaded are written
+# Files ending in .gaproj are saved in the binary format (see anim_project_binary), everything else as JSON
+def save_project(file: str, project: AnimProject, max_workers: Optional[int] = None, incremental: bool = True) -> None:
+    if is_binary_project_path(file):
+        proj_data, asset_dict = encode_project(project)
+    else:
+        proj_json, asset_dict = project.save_json()
+        proj_data = json.dumps(proj_json).encode()
     asset_path = os.path.splitext(file)[0] + "_assets"
     if not os.path.exists(asset_path):
         os.makedirs(asset_path)
-    for path in asset_dict:
-        obj = asset_dict[path]
-        if isinstance(obj, Image.Image):
-            write_image(os.path.join(asset_path, path), obj)
+    changed = project.get_changed_assets(asset_path, asset_dict) if incremental else asset_dict
+    with ImageExporter(max_workers) as exporter:
+        for path in changed:
+            obj = changed[path]
+            if isinstance(obj, AssetFile):
+                # Copying the file is cheaper than encoding, and keeps it exactly the same
+                # An atlas renamed to another format (like .png to .tex) has to be encoded again though
+                same_format = os.path.splitext(obj.path)[1].lower() == os.path.splitext(path)[1].lower()
+                if same_format and os.path.isfile(obj.path):
+                    exporter.add_copy(os.path.join(asset_path, path), lambda source_path=obj.path: open(source_path, "rb"))
+                elif obj.image is not None:
+                    exporter.add_image(os.path.join(asset_path, path), obj.image)
+                elif os.path.isfile(obj.path):
+                    exporter.add_image(os.path.join(asset_path, path), read_cached_image(obj.path, copy=False))
+            elif isinstance(obj, Image.Image):
+                exporter.add_image(os.path.join(asset_path, path), obj)
+        exporter.encode()
+        write_file_atomic(file, proj_data)
+        exporter.write()
+    project.mark_saved(asset_path)
 
-def load_project(file: str) -> AnimProject:
+# Atlas sources are read when first accessed. preload reads them on a background thread meanwhile
+def load_project(file: str, preload: bool = False) -> AnimProject:
     asset_path = os.path.splitext(file)[0] + "_assets"
-    with open(file, "r") as proj_file:
-        obj = json.load(proj_file)
-        project = AnimProject()
+    if is_binary_project_path(file):
+        with open(file, "rb") as proj_file:
+            project = decode_project(proj_file.read(), asset_path)
+    else:
+        with open(file, "r") as proj_file:
+            project = AnimProject()
+            project.load_json_stream(proj_file, asset_path)
 
-        project.load_json(obj, asset_path)
+    project.mark_saved(asset_path)
+    if preload:
+        project.preload_sources()
 
-        return project
+    return project
+
+# Save a project in another format (or location), upgrading it to the latest version. Its assets are copied without decoding them
+def convert_project(source: str, destination: str, max_workers: Optional[int] = None) -> None:
+    save_project(destination, load_project(source), max_workers)
@@ -0,0 +1,113 @@
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, Optional
+import os, posixpath, zipfile
+
+ANIM_FILES = ("build.bin", "anim.bin")
+
+# Where the files of an animation (build.bin, anim.bin and the materials) are read from
+class AnimSource:
+    def __enter__(self) -> 'AnimSource':
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        pass
+
+    def exists(self, name: str) -> bool:
+        raise NotImplementedError("Function not implemented")
+
+    # Open a file of the animation for reading
+    @contextmanager
+    def open(self, name: str) -> Iterator[BinaryIO]:
+        raise NotImplementedError("Function not implemented")
+        yield
+
+    def read_bytes(self, name: str) -> bytes:
+        with self.open(name) as file:
+            return file.read()
+
+    # Path of the file on disk, if it is a regular file
+    def get_path(self, name: str) -> Optional[str]:
+        return None
+
+class FolderSource(AnimSource):
+    def __init__(self, folder: str) -> None:
+        self.folder = folder
+
+    def exists(self, name: str) -> bool:
+        return os.path.isfile(os.path.join(self.folder, name))
+
+    @contextmanager
+    def open(self, name: str) -> Iterator[BinaryIO]:
+        with open(os.path.join(self.folder, name), "rb") as file:
+            yield file
+
+    def get_path(self, name: str) -> Optional[str]:
+        return os.path.join(self.folder, name)
+
+    def __str__(self) -> str:
+        return self.folder
+
+# Reads the members of a zip archive without extracting it
+# While used as a context manager, the archive is kept open between reads
+class ZipSource(AnimSource):
+    def __init__(self, archive_path: str, prefix: Optional[str] = None) -> None:
+        self.archive_path = archive_path
+        self._archive: Optional[zipfile.ZipFile] = None
+        if prefix is None:
+            with zipfile.ZipFile(archive_path) as archive:
+                prefix = ZipSource.find_prefix(archive.namelist())
+        self.prefix = prefix
+
+    # The folder inside the archive that holds build.bin or anim.bin (the shallowest one)
+    @staticmethod
+    def find_prefix(names: list[str]) -> str:
+        folders = [posixpath.dirname(name) for name in names if posixpath.basename(name) in ANIM_FILES]
+        if not folders:
+            return ""
+        folder = min(folders, key=lambda f: (f.count("/"), f))
+        return folder + "/" if folder else ""
+
+    def __enter__(self) -> 'ZipSource':
+        self._archive = zipfile.ZipFile(self.archive_path)
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        if self._archive is not None:
+            self._archive.close()
+            self._archive = None
+
+    def get_member_name(self, name: str) -> str:
+        return self.prefix + name.replace(os.sep, "/")
+
+    def exists(self, name: str) -> bool:
+        if self._archive is not None:
+            return self.__exists(self._archive, name)
+        with zipfile.ZipFile(self.archive_path) as archive:
+            return self.__exists(archive, name)
+
+    def __exists(self, archive: zipfile.ZipFile, name: str) -> bool:
+        try:
+            archive.getinfo(self.get_member_name(name))
+            return True
+        except KeyError:
+            return False
+
+    @contextmanager
+    def open(self, name: str) -> Iterator[BinaryIO]:
+        if self._archive is not None:
+            with self._archive.open(self.get_member_name(name)) as file:
+                yield file
+        else:
+            with zipfile.ZipFile(self.archive_path) as archive, archive.open(self.get_member_name(name)) as file:
+                yield file
+
+    def __str__(self) -> str:
+        return os.path.join(self.archive_path, self.prefix)
+
+def is_zip_path(path: str) -> bool:
+    return os.path.isfile(path) and zipfile.is_zipfile(path)
+
+def open_anim_source(path: str) -> AnimSource:
+    if is_zip_path(path):
+        return ZipSource(path)
+    return FolderSource(path)
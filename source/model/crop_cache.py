@@ -0,0 +1,123 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from PIL import Image
+from typing import Optional
+import threading
+
+from source.model.ganim_format import *
+from source.model.ganim_lazy_build import LazyBuildMaterial
+from source.model.image_format import get_image_nbytes
+
+# (image_index, uv0.x, uv0.y, uv1.x, uv1.y)
+UVRect = tuple[int, float, float, float, float]
+# (left, top, right, bottom) in pixels
+CropBox = tuple[int, int, int, int]
+
+def get_uv_rect(frame: BuildFrame) -> UVRect:
+    return (frame.image_index, frame.uv0.x, frame.uv0.y, frame.uv1.x, frame.uv1.y)
+
+# Pixel box of a uv rect in an image of the given size
+def get_uv_box(rect: UVRect, size: tuple[int, int]) -> CropBox:
+    _, u0, v0, u1, v1 = rect
+    width, height = size
+    return (round(width * u0), round(height * v0), round(width * u1), round(height * v1))
+
+# Size of a material's image, without loading lazy materials
+def get_material_size(material: BuildMaterial) -> Optional[tuple[int, int]]:
+    if isinstance(material, LazyBuildMaterial) and not material.assigned:
+        return material.size
+    return material.image.size if material.image is not None else None
+
+@dataclass
+class CachedCrop:
+    image: Image.Image
+    nbytes: int
+
+# Images of build frames, cropped out of their materials, shared by everything that draws the frames of a build
+# Crops are keyed by uv rect (and whether they are premultiplied), and evicted least recently used first once they exceed max_bytes
+# Materials are only read when a crop isn't cached, so cached crops don't keep (or make) lazy materials load
+# Call invalidate after changing a material's image
+class CropCache:
+    def __init__(self, build: BuildFile, max_bytes: Optional[int] = 256 << 20) -> None:
+        self.build = build
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple[UVRect, bool], CachedCrop] = OrderedDict()
+        # Pixel boxes are tiny, so all of them are kept. None for rects that are empty or have no image
+        self._boxes: dict[UVRect, Optional[CropBox]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_box(self, rect: UVRect) -> Optional[CropBox]:
+        if rect not in self._boxes:
+            box = None
+            if 0 <= rect[0] < len(self.build.materials):
+                size = get_material_size(self.build.materials[rect[0]])
+                if size is not None:
+                    box = get_uv_box(rect, size)
+                    if box[2] <= box[0] or box[3] <= box[1]:
+                        box = None
+            self._boxes[rect] = box
+        return self._boxes[rect]
+
+    def get_frame_box(self, frame: BuildFrame) -> Optional[CropBox]:
+        return self.get_box(get_uv_rect(frame))
+
+    # RGBA crop of the rect, or RGBa if premultiplied. None if get_box is None
+    # The image is shared, so it must not be modified
+    def get(self, rect: UVRect, premultiplied: bool = False) -> Optional[Image.Image]:
+        key = (rect, premultiplied)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.image
+            self.misses += 1
+        box = self.get_box(rect)
+        if box is None:
+            return None
+        image = self.build.materials[rect[0]].image
+        if image is None:
+            return None
+        crop = image.crop(box)
+        crop = crop if crop.mode == "RGBA" else crop.convert("RGBA")
+        if premultiplied:
+            crop = crop.convert("RGBa")
+        self.put(key, CachedCrop(crop, get_image_nbytes(crop)))
+        return crop
+
+    def get_frame(self, frame: BuildFrame, premultiplied: bool = False) -> Optional[Image.Image]:
+        return self.get(get_uv_rect(frame), premultiplied)
+
+    def put(self, key: tuple[UVRect, bool], entry: CachedCrop) -> None:
+        with self._lock:
+            self.__forget(key)
+            # Crops larger than the whole budget are not kept
+            if self.max_bytes is not None and entry.nbytes > self.max_bytes:
+                return
+            self._entries[key] = entry
+            self.total_bytes += entry.nbytes
+            while self.max_bytes is not None and self.total_bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self.total_bytes -= evicted.nbytes
+
+    def __forget(self, key: tuple[UVRect, bool]) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry.nbytes
+
+    # Drop the crops of one material (or all of them)
+    def invalidate(self, image_index: Optional[int] = None) -> None:
+        with self._lock:
+            for key in [key for key in self._entries if image_index is None or key[0][0] == image_index]:
+                self.__forget(key)
+            for rect in [rect for rect in self._boxes if image_index is None or rect[0] == image_index]:
+                del self._boxes[rect]
+
+    def clear(self) -> None:
+        self.invalidate()
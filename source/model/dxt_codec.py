@@ -0,0 +1,210 @@
+import numpy as np
+
+# Block-compressed texture formats (BC1/DXT1 and BC3/DXT5), decoded and encoded a whole image at a time
+# Each 4x4 block of pixels is a row of a NumPy array, so all the blocks are processed together
+# Decoding gives the same results as Pillow's DDS decoder
+
+BC1_BLOCK_DTYPE = np.dtype([("c0", "<u2"), ("c1", "<u2"), ("indices", "<u4")])
+BC3_BLOCK_DTYPE = np.dtype([("a0", "u1"), ("a1", "u1"), ("alpha_indices", "u1", (6,)), ("color", BC1_BLOCK_DTYPE)])
+BLOCK_SIZES = {"DXT1": BC1_BLOCK_DTYPE.itemsize, "DXT5": BC3_BLOCK_DTYPE.itemsize}
+
+# Shifts to get the index of each of the 16 pixels of a block
+COLOR_SHIFTS = np.arange(16, dtype=np.uint32) * 2
+ALPHA_SHIFTS = np.arange(16, dtype=np.uint64) * 3
+# Alpha indices are decoded 8 at a time, from each group of 3 bytes
+ALPHA_GROUP_SHIFTS = np.arange(8, dtype=np.uint32) * 3
+
+def get_block_count(width: int, height: int) -> tuple[int, int]:
+    return (width + 3) // 4, (height + 3) // 4
+
+def get_data_size(pixel_format: str, width: int, height: int) -> int:
+    blocks_x, blocks_y = get_block_count(width, height)
+    return blocks_x * blocks_y * BLOCK_SIZES[pixel_format]
+
+def decode_565(colors: np.ndarray) -> np.ndarray:
+    colors = colors.astype(np.uint16)
+    r = (colors & 0xf800) >> 8
+    g = (colors & 0x07e0) >> 3
+    b = (colors & 0x001f) << 3
+    return np.stack([r | (r >> 5), g | (g >> 6), b | (b >> 5)], axis=-1)
+
+def encode_565(rgb: np.ndarray) -> np.ndarray:
+    rgb = np.clip(np.rint(rgb), 0, 255).astype(np.uint16)
+    return ((rgb[..., 0] >> 3) << 11) | ((rgb[..., 1] >> 2) << 5) | (rgb[..., 2] >> 3)
+
+# Palette of 4 RGBA colors for each block. always_four_colors is used by BC3, which ignores the order of c0 and c1
+def get_color_palette(c0: np.ndarray, c1: np.ndarray, always_four_colors: bool) -> np.ndarray:
+    p0 = COLOR_565_TABLE[c0]
+    p1 = COLOR_565_TABLE[c1]
+    four_colors = (c0 > c1) | always_four_colors
+    palette = np.empty((len(c0), 4, 4), np.uint8)
+    palette[:, 0, :3] = p0
+    palette[:, 1, :3] = p1
+    # Interpolated colors fit in 16 bits: 2 * 255 + 255 < 2 ** 15
+    p0 = p0.astype(np.int16)
+    p1 = p1.astype(np.int16)
+    if always_four_colors:
+        palette[:, 2, :3] = (2 * p0 + p1) // 3
+        palette[:, 3, :3] = (p0 + 2 * p1) // 3
+    else:
+        palette[:, 2, :3] = np.where(four_colors[:, None], (2 * p0 + p1) // 3, (p0 + p1) // 2)
+        palette[:, 3, :3] = np.where(four_colors[:, None], (p0 + 2 * p1) // 3, 0)
+    palette[:, :, 3] = 255
+    palette[:, 3, 3] = np.where(four_colors, 255, 0)
+    return palette
+
+def make_alpha_palette(a0: np.ndarray, a1: np.ndarray) -> np.ndarray:
+    a0 = a0.astype(np.int32)[:, None]
+    a1 = a1.astype(np.int32)[:, None]
+    steps = np.arange(1, 7)
+    eight_alphas = ((7 - steps) * a0 + steps * a1) // 7
+    steps = np.arange(1, 5)
+    six_alphas = np.concatenate([((5 - steps) * a0 + steps * a1) // 5, np.zeros_like(a0), np.full_like(a0, 255)], axis=1)
+    middle = np.where(a0 > a1, eight_alphas, six_alphas)
+    return np.concatenate([a0, a1, middle], axis=1).astype(np.uint8)
+
+# Colors and alpha palettes only depend on 16 bits of the block, so they are looked up in tables
+COLOR_565_TABLE = decode_565(np.arange(1 << 16, dtype=np.uint16)).astype(np.uint8)
+ALPHA_PALETTE_TABLE = make_alpha_palette(np.arange(1 << 16) >> 8, np.arange(1 << 16) & 0xff)
+
+def get_alpha_palette(a0: np.ndarray, a1: np.ndarray) -> np.ndarray:
+    return ALPHA_PALETTE_TABLE[(a0.astype(np.intp) << 8) | a1]
+
+# Turn (blocks_y * blocks_x, 16, 4) block pixels into a (height, width, 4) image
+def blocks_to_image(pixels: np.ndarray, width: int, height: int) -> np.ndarray:
+    blocks_x, blocks_y = get_block_count(width, height)
+    image = pixels.reshape(blocks_y, blocks_x, 4, 4, 4).transpose(0, 2, 1, 3, 4).reshape(blocks_y * 4, blocks_x * 4, 4)
+    return np.ascontiguousarray(image[:height, :width])
+
+# Turn a (height, width, 4) image into (blocks, 16, 4) block pixels, repeating the edge pixels to fill partial blocks
+def image_to_blocks(image: np.ndarray) -> np.ndarray:
+    height, width = image.shape[:2]
+    blocks_x, blocks_y = get_block_count(width, height)
+    image = np.pad(image, ((0, blocks_y * 4 - height), (0, blocks_x * 4 - width), (0, 0)), mode="edge")
+    return image.reshape(blocks_y, 4, blocks_x, 4, 4).transpose(0, 2, 1, 3, 4).reshape(blocks_y * blocks_x, 16, 4)
+
+# The 4 two-bit indices packed in each byte, lowest bits first
+COLOR_INDEX_TABLE = ((np.arange(256, dtype=np.uint8)[:, None] >> np.arange(0, 8, 2, dtype=np.uint8)) & 3).astype(np.uint8)
+
+# Look up one palette entry per pixel. Palettes are (blocks, entries) arrays, indices are (blocks, 16)
+def gather(palette: np.ndarray, indices: np.ndarray) -> np.ndarray:
+    offsets = np.arange(0, palette.size, palette.shape[1], dtype=np.intp)[:, None]
+    return palette.ravel()[indices + offsets]
+
+def decode_color_blocks(blocks: np.ndarray, always_four_colors: bool) -> np.ndarray:
+    # Each RGBA palette entry is handled as a single 32-bit value
+    palette = get_color_palette(blocks["c0"], blocks["c1"], always_four_colors).view(np.uint32)[:, :, 0]
+    index_bytes = blocks["indices"].astype("<u4").view(np.uint8).reshape(-1, 4)
+    indices = COLOR_INDEX_TABLE[index_bytes].reshape(-1, 16)
+    return gather(palette, indices).view(np.uint8).reshape(-1, 16, 4)
+
+def decode_bc3_blocks(blocks: np.ndarray) -> np.ndarray:
+    pixels = decode_color_blocks(blocks["color"], True)
+    # The 48 bits of alpha indices are two groups of 8 three-bit indices, lowest bits first
+    groups = blocks["alpha_indices"].reshape(-1, 2, 3).astype(np.uint32)
+    groups = groups[:, :, 0] | (groups[:, :, 1] << 8) | (groups[:, :, 2] << 16)
+    alpha_indices = ((groups[:, :, None] >> ALPHA_GROUP_SHIFTS) & 7).reshape(-1, 16)
+    palette = get_alpha_palette(blocks["a0"], blocks["a1"])
+    pixels[:, :, 3] = gather(palette, alpha_indices)
+    return pixels
+
+# Blocks are processed in chunks to bound the size of the temporary arrays
+CHUNK_BLOCKS = 1 << 14
+
+def decode_blocks(blocks: np.ndarray, decode_chunk) -> np.ndarray:
+    pixels = np.empty((len(blocks), 16, 4), np.uint8)
+    for start in range(0, len(blocks), CHUNK_BLOCKS):
+        pixels[start:start + CHUNK_BLOCKS] = decode_chunk(blocks[start:start + CHUNK_BLOCKS])
+    return pixels
+
+def decode_bc1(data: bytes, width: int, height: int) -> np.ndarray:
+    blocks_x, blocks_y = get_block_count(width, height)
+    blocks = np.frombuffer(data, BC1_BLOCK_DTYPE, blocks_x * blocks_y)
+    return blocks_to_image(decode_blocks(blocks, lambda chunk: decode_color_blocks(chunk, False)), width, height)
+
+def decode_bc3(data: bytes, width: int, height: int) -> np.ndarray:
+    blocks_x, blocks_y = get_block_count(width, height)
+    blocks = np.frombuffer(data, BC3_BLOCK_DTYPE, blocks_x * blocks_y)
+    return blocks_to_image(decode_blocks(blocks, decode_bc3_blocks), width, height)
+
+# Pick the nearest palette entry for every pixel
+def nearest_index(values: np.ndarray, palette: np.ndarray) -> np.ndarray:
+    distance = ((values[:, :, None, :] - palette[:, None, :, :]) ** 2).sum(axis=-1)
+    return distance.argmin(axis=-1)
+
+# Bounding box endpoints, inset slightly to reduce the error of the interpolated colors
+def get_endpoints(values: np.ndarray, mask: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+    if mask is None:
+        high = values.max(axis=1)
+        low = values.min(axis=1)
+    else:
+        high = np.where(mask[:, :, None], values, -np.inf).max(axis=1)
+        low = np.where(mask[:, :, None], values, np.inf).min(axis=1)
+        # Blocks with no pixels to fit
+        empty = ~mask.any(axis=1)
+        high[empty] = 0
+        low[empty] = 0
+    inset = (high - low) / 16
+    return high - inset, low + inset
+
+def encode_color_blocks(pixels: np.ndarray, allow_transparent: bool) -> np.ndarray:
+    rgb = pixels[:, :, :3].astype(np.float32)
+    transparent = pixels[:, :, 3] < 128 if allow_transparent else np.zeros(rgb.shape[:2], bool)
+    has_transparent = transparent.any(axis=1)
+    high, low = get_endpoints(rgb, ~transparent)
+    c0 = encode_565(high)
+    c1 = encode_565(low)
+    # Four color blocks need c0 > c1, and blocks with transparent pixels need c0 <= c1
+    swap = np.where(has_transparent, c0 > c1, c0 < c1)
+    c0, c1 = np.where(swap, c1, c0), np.where(swap, c0, c1)
+    four_colors = c0 > c1
+    palette = get_color_palette(c0, c1, False).astype(np.float32)
+    # Only the transparent pixels may use the transparent entry
+    palette[~four_colors, 3, :3] = np.inf
+    indices = nearest_index(rgb, palette[:, :, :3])
+    indices[transparent] = 3
+    # Blocks of a single color have no c0 > c1 ordering, so every pixel uses c0
+    indices[(c0 == c1) & ~has_transparent] = 0
+    blocks = np.empty(len(pixels), BC1_BLOCK_DTYPE)
+    blocks["c0"] = c0
+    blocks["c1"] = c1
+    blocks["indices"] = (indices.astype(np.uint32) << COLOR_SHIFTS).sum(axis=1, dtype=np.uint32)
+    return blocks
+
+def encode_bc3_blocks(pixels: np.ndarray) -> np.ndarray:
+    blocks = np.empty(len(pixels), BC3_BLOCK_DTYPE)
+    # BC3 color blocks are always decoded as four color blocks
+    blocks["color"] = encode_color_blocks(pixels, False)
+
+    alpha = pixels[:, :, 3].astype(np.int32)
+    a0 = alpha.max(axis=1)
+    a1 = alpha.min(axis=1)
+    palette = get_alpha_palette(a0, a1).astype(np.int32)
+    alpha_indices = np.abs(alpha[:, :, None] - palette[:, None, :]).argmin(axis=-1)
+    # a0 == a1 uses the six alpha palette, whose entries 6 and 7 are 0 and 255
+    alpha_indices[a0 == a1] = 0
+    alpha_bits = (alpha_indices.astype(np.uint64) << ALPHA_SHIFTS).sum(axis=1, dtype=np.uint64)
+    blocks["a0"] = a0
+    blocks["a1"] = a1
+    for i in range(6):
+        blocks["alpha_indices"][:, i] = (alpha_bits >> np.uint64(8 * i)) & np.uint64(0xff)
+    return blocks
+
+def encode_blocks(image: np.ndarray, dtype: np.dtype, encode_chunk) -> bytes:
+    pixels = image_to_blocks(image)
+    blocks = np.empty(len(pixels), dtype)
+    for start in range(0, len(pixels), CHUNK_BLOCKS):
+        blocks[start:start + CHUNK_BLOCKS] = encode_chunk(pixels[start:start + CHUNK_BLOCKS])
+    return blocks.tobytes()
+
+# image is a (height, width, 4) RGBA array
+def encode_bc1(image: np.ndarray) -> bytes:
+    return encode_blocks(image, BC1_BLOCK_DTYPE, lambda chunk: encode_color_blocks(chunk, True))
+
+def encode_bc3(image: np.ndarray) -> bytes:
+    return encode_blocks(image, BC3_BLOCK_DTYPE, encode_bc3_blocks)
+
+DECODERS = {"DXT1": decode_bc1, "DXT5": decode_bc3}
+ENCODERS = {"DXT1": encode_bc1, "DXT5": encode_bc3}
+# Codec format for each block compression, which also covers DDS files using a DX10 header
+COMPRESSION_FORMATS = {"BC1": "DXT1", "BC3": "DXT5"}
@@ -1,4 +1,8 @@
 from source.model.ganim_format import Animation
+from struct import Struct
+from typing import Any, BinaryIO, Callable, Optional, TypeVar
+
+T = TypeVar("T")
 
 class AnimFileIO:
     @staticmethod
@@ -12,3 +16,103 @@ class AnimFileIO:
 class WrongFormatException(Exception):
     def __init__(self, *args: object) -> None:
         super().__init__(*args)
+
+# Reads values out of a buffer (bytes, mmap, ...) by offset, without copying it
+# Release the reader (or use it as a context manager) before closing an mmap it wraps
+class BufferReader:
+    def __init__(self, buffer: Any, offset: int = 0) -> None:
+        self.view = memoryview(buffer)
+        self.offset = offset
+
+    def __enter__(self) -> 'BufferReader':
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.release()
+
+    def release(self) -> None:
+        self.view.release()
+
+    def __len__(self) -> int:
+        return len(self.view)
+
+    def remaining(self) -> int:
+        return len(self.view) - self.offset
+
+    def at_end(self) -> bool:
+        return self.offset >= len(self.view)
+
+    def skip(self, size: int) -> None:
+        if size > self.remaining():
+            raise EOFError("EOF reached")
+        self.offset += size
+
+    def unpack(self, struct: Struct) -> tuple[Any, ...]:
+        if struct.size > self.remaining():
+            raise EOFError("EOF reached")
+        val = struct.unpack_from(self.view, self.offset)
+        self.offset += struct.size
+        return val
+
+    # Unpack `count` consecutive records, passing each through `make`
+    def unpack_records(self, struct: Struct, count: int, make: Callable[[tuple[Any, ...]], T]) -> list[T]:
+        end = self.offset + struct.size * count
+        if end > len(self.view):
+            raise EOFError("EOF reached")
+        view, unpack_from = self.view, struct.unpack_from
+        result = [make(unpack_from(view, offset)) for offset in range(self.offset, end, struct.size)]
+        self.offset = end
+        return result
+
+    def read_str(self, size: int, encoding: str) -> str:
+        if size > self.remaining():
+            raise EOFError("EOF reached")
+        val = str(self.view[self.offset:self.offset + size], encoding)
+        self.offset += size
+        return val
+
+# Packs values into a bytearray, handing it to the sink in large chunks
+# Without a sink, everything is kept in memory and can be taken with getvalue()
+class BufferWriter:
+    def __init__(self, sink: Optional[BinaryIO] = None, chunk_size: int = 1 << 20) -> None:
+        self.buffer = bytearray()
+        self.sink = sink
+        self.chunk_size = chunk_size
+
+    def __enter__(self) -> 'BufferWriter':
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.flush()
+
+    def __maybe_flush(self) -> None:
+        if self.sink is not None and len(self.buffer) >= self.chunk_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.sink is not None and self.buffer:
+            self.sink.write(self.buffer)
+            self.buffer = bytearray()
+
+    def write(self, data: bytes) -> None:
+        self.buffer += data
+        self.__maybe_flush()
+
+    def pack(self, struct: Struct, *values: Any) -> None:
+        self.buffer += struct.pack(*values)
+        self.__maybe_flush()
+
+    # Pack a run of records into space reserved at the end of the buffer
+    def pack_records(self, struct: Struct, records: list[tuple[Any, ...]]) -> None:
+        offset = len(self.buffer)
+        self.buffer.extend(bytes(struct.size * len(records)))
+        buffer, size, pack_into = self.buffer, struct.size, struct.pack_into
+        for record in records:
+            pack_into(buffer, offset, *record)
+            offset += size
+        self.__maybe_flush()
+
+    def getvalue(self) -> bytes:
+        if self.sink is not None:
+            raise ValueError("Writer has a sink")
+        return bytes(self.buffer)
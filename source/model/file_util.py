@@ -0,0 +1,121 @@
+from typing import Any, Container, Generator, TextIO
+import json, os, re, stat, tempfile
+
+# The umask can only be read by setting it, so it is read once, on import
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+# Create a temporary file next to path, to be moved over it once written. Returns its descriptor and path
+# mkstemp makes files only their owner can read, so it gets the permissions of the file it replaces, or those of a new file
+def make_temp_file(path: str) -> tuple[int, str]:
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=folder, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            mode = 0o666 & ~UMASK
+        os.chmod(temp_path, mode)
+    except BaseException:
+        os.close(fd)
+        os.remove(temp_path)
+        raise
+    return fd, temp_path
+
+# Write a file under a temporary name first, so readers (possibly in another process) never see it half written
+# and a failed write leaves the old file in place
+def write_file_atomic(path: str, data: bytes) -> None:
+    fd, temp_path = make_temp_file(path)
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+JSON_WHITESPACE = " \t\n\r"
+JSON_NUMBER_START = "-0123456789"
+JSON_NUMBER_END = re.compile(r"[ \t\n\r,\]}]")
+
+# Reads JSON values from a text file a chunk at a time, keeping only what wasn't decoded yet in memory
+class JsonStreamReader:
+    def __init__(self, file: TextIO, chunk_size: int = 1 << 16) -> None:
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    # The next character that isn't whitespace, without consuming it ("" at the end of the file)
+    def peek(self) -> str:
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in JSON_WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, chars: str) -> str:
+        char = self.peek()
+        if not char or char not in chars:
+            raise json.JSONDecodeError(f"Expecting one of {chars!r}", self.buffer, self.pos)
+        self.pos += 1
+        return char
+
+    def decode(self) -> Any:
+        # Numbers can be cut by the end of a chunk and still decode, so make sure the whole number was read
+        if self.peek() in JSON_NUMBER_START:
+            while not JSON_NUMBER_END.search(self.buffer, self.pos) and self.fill():
+                pass
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # The value may continue in the next chunk
+                if self.fill():
+                    continue
+                raise
+            self.pos = end
+            return value
+
+# The members of the JSON object in file as (key, value), in file order
+# The arrays under stream_keys aren't decoded as a whole: each of their items is a member of its own, with the array's key
+def iter_json_members(file: TextIO, stream_keys: Container[str] = (), chunk_size: int = 1 << 16) -> Generator[tuple[str, Any], None, None]:
+    reader = JsonStreamReader(file, chunk_size)
+    reader.expect("{")
+    if reader.peek() == "}":
+        reader.expect("}")
+        return
+    while True:
+        key = reader.decode()
+        if not isinstance(key, str):
+            raise json.JSONDecodeError("Expecting property name", reader.buffer, reader.pos)
+        reader.expect(":")
+        if key in stream_keys and reader.peek() == "[":
+            reader.expect("[")
+            if reader.peek() == "]":
+                reader.expect("]")
+            else:
+                while True:
+                    yield key, reader.decode()
+                    if reader.expect(",]") == "]":
+                        break
+        else:
+            yield key, reader.decode()
+        if reader.expect(",}") == "}":
+            return
@@ -0,0 +1,237 @@
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, asdict
+from multiprocessing import shared_memory
+from PIL import Image
+from typing import Optional
+import json, math, os, re
+import numpy as np
+
+from source.model.ganim_format import *
+from source.model.ganim_render import FrameRenderer, Bounds, get_element_array
+
+# Renders every frame of anims to PNG sequences or sprite sheets on a pool of processes
+# The build's atlases are decoded once, in the parent, and shared with the workers through shared memory
+# Sprite sheets are shared the same way, so workers draw their frames straight into them
+
+@dataclass
+class FrameExportOptions:
+    # "sequence" writes <anim>/<anim>_0000.png for every frame, "sheet" writes <anim>.png with every frame, and <anim>.json describing it
+    layout: str = "sequence"
+    # Pixels per unit of anim space, unless max_size is given
+    scale: float = 1.0
+    # Fit every frame in max_size x max_size
+    max_size: Optional[int] = None
+    # Columns of sprite sheets (default: about as many as rows)
+    columns: Optional[int] = None
+    # Space between the frames of sprite sheets
+    padding: int = 0
+    background: tuple[int, int, int, int] = (0, 0, 0, 0)
+
+LAYOUTS = ("sequence", "sheet")
+
+@dataclass
+class SheetFrame:
+    x: int = 0
+    y: int = 0
+    width: int = 0
+    height: int = 0
+
+# Written next to every sprite sheet
+@dataclass
+class SheetInfo:
+    image: str = ""
+    anim_name: str = ""
+    frame_rate: float = 0.0
+    looping: bool = False
+    # Area of anim space that every frame shows (left, top, right, bottom)
+    bounds: Bounds = (0.0, 0.0, 0.0, 0.0)
+    scale: float = 1.0
+    frames: list[SheetFrame] = field(default_factory=list)
+
+# An image in shared memory, as passed to workers: (shared memory name, mode, size)
+SharedImageInfo = tuple[str, str, tuple[int, int]]
+
+# RGBA copies of images in shared memory. Call close() (or use as a context manager) to free them
+class SharedImages:
+    def __init__(self) -> None:
+        self.blocks: list[shared_memory.SharedMemory] = []
+        self.infos: list[Optional[SharedImageInfo]] = []
+
+    def __enter__(self) -> 'SharedImages':
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+    def add(self, image: Optional[Image.Image]) -> None:
+        if image is None:
+            self.infos.append(None)
+            return
+        image = image if image.mode == "RGBA" else image.convert("RGBA")
+        block = self.create(image.size)
+        np.ndarray((image.height, image.width, 4), np.uint8, block.buf)[:] = np.asarray(image)
+        self.infos.append((block.name, "RGBA", image.size))
+
+    def create(self, size: tuple[int, int]) -> shared_memory.SharedMemory:
+        block = shared_memory.SharedMemory(create=True, size=max(1, size[0] * size[1] * 4))
+        self.blocks.append(block)
+        return block
+
+    def close(self) -> None:
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+        self.infos = []
+
+def get_shared_array(block: shared_memory.SharedMemory, size: tuple[int, int]) -> np.ndarray:
+    return np.ndarray((size[1], size[0], 4), np.uint8, block.buf)
+
+# The parts of a build that rendering needs, without images (or anything else that can't be sent to other processes)
+def strip_build(build: BuildFile) -> BuildFile:
+    result = BuildFile(build.version, build.total_frames, build.build_name)
+    result.materials = [BuildMaterial(material.path) for material in build.materials]
+    result.symbols = [BuildSymbol(HashRef(symbol.symbol_hash.hash_val, result), HashRef(symbol.color_channel_hash.hash_val, result), symbol.looping, symbol.frames)
+        for symbol in build.symbols]
+    return result
+
+# A frame to render: the elements, where to write it, and where in a sheet (if any) to draw it
+@dataclass
+class FrameTask:
+    elements: np.ndarray
+    bounds: Bounds
+    scale: float
+    size: tuple[int, int]
+    path: Optional[str] = None
+    sheet: Optional[SharedImageInfo] = None
+    position: tuple[int, int] = (0, 0)
+
+# State of a worker process, set by init_worker
+worker_renderer: Optional[FrameRenderer] = None
+worker_options = FrameExportOptions()
+worker_blocks: dict[str, shared_memory.SharedMemory] = {}
+
+def get_worker_block(name: str) -> shared_memory.SharedMemory:
+    if name not in worker_blocks:
+        worker_blocks[name] = shared_memory.SharedMemory(name=name)
+    return worker_blocks[name]
+
+def init_worker(build: BuildFile, atlases: list[Optional[SharedImageInfo]], options: FrameExportOptions) -> None:
+    global worker_renderer, worker_options
+    for material, info in zip(build.materials, atlases):
+        if info is not None:
+            name, mode, size = info
+            material.image = Image.frombuffer(mode, size, get_worker_block(name).buf, "raw", mode, 0, 1)
+    worker_renderer = FrameRenderer(build)
+    worker_options = options
+
+def render_task(task: FrameTask) -> None:
+    assert worker_renderer is not None
+    image = worker_renderer.render(task.elements, task.bounds, task.scale, background=worker_options.background)
+    if task.path is not None:
+        image.save(task.path, "PNG")
+    if task.sheet is not None:
+        name, _, sheet_size = task.sheet
+        x, y = task.position
+        get_shared_array(get_worker_block(name), sheet_size)[y:y + task.size[1], x:x + task.size[0]] = np.asarray(image)
+
+def render_tasks(tasks: list[FrameTask]) -> None:
+    for task in tasks:
+        render_task(task)
+
+def get_frame_bounds(frame: AnimFrame) -> Optional[Bounds]:
+    if frame.size.x <= 0 or frame.size.y <= 0:
+        return None
+    return (frame.pos.x - frame.size.x / 2, frame.pos.y - frame.size.y / 2, frame.pos.x + frame.size.x / 2, frame.pos.y + frame.size.y / 2)
+
+# Area that every frame of the anim fits in, so frames line up when played back
+def get_anim_bounds(renderer: FrameRenderer, anim: AnimData) -> Bounds:
+    boxes = [get_frame_bounds(frame) or renderer.get_bounds(get_element_array(frame.elements)) for frame in anim.frames]
+    boxes = [box for box in boxes if box is not None]
+    if not boxes:
+        return (0.0, 0.0, 1.0, 1.0)
+    return (min(box[0] for box in boxes), min(box[1] for box in boxes), max(box[2] for box in boxes), max(box[3] for box in boxes))
+
+def get_safe_name(name: str) -> str:
+    return re.sub(r'[<>:"/\\|?*\x00-\x1f]', "_", name) or "anim"
+
+# Safe name for an anim that no other anim uses yet, adding a number if needed (like "a_b" and "a_b_2" for "a/b" and "a:b")
+# Names are compared ignoring case, as most file systems on Windows and macOS do
+def get_unique_name(name: str, used: set[str]) -> str:
+    name = get_safe_name(name)
+    unique, number = name, 1
+    while unique.casefold() in used:
+        number += 1
+        unique = f"{name}_{number}"
+    used.add(unique.casefold())
+    return unique
+
+# Render every frame of anims from build into output_folder, on jobs processes (default: number of CPUs)
+# Returns the paths of the files written
+def export_frames(build: BuildFile, anims: list[AnimData], output_folder: str, options: Optional[FrameExportOptions] = None, jobs: Optional[int] = None) -> list[str]:
+    options = options or FrameExportOptions()
+    if options.layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout: {options.layout}")
+    renderer = FrameRenderer(build)
+    os.makedirs(output_folder, exist_ok=True)
+    written: list[str] = []
+    with SharedImages() as shared:
+        tasks: list[FrameTask] = []
+        sheets: list[tuple[SheetInfo, SharedImageInfo, str]] = []
+        used_names: set[str] = set()
+        for anim in anims:
+            name = get_unique_name(anim.anim_name, used_names)
+            bounds = get_anim_bounds(renderer, anim)
+            width, height = bounds[2] - bounds[0], bounds[3] - bounds[1]
+            scale = options.scale if options.max_size is None else options.max_size / max(width, height, 1e-6)
+            size = (max(1, math.ceil(width * scale)), max(1, math.ceil(height * scale)))
+            if options.layout == "sequence":
+                anim_folder = os.path.join(output_folder, name)
+                os.makedirs(anim_folder, exist_ok=True)
+                for i, frame in enumerate(anim.frames):
+                    path = os.path.join(anim_folder, f"{name}_{i:04d}.png")
+                    tasks.append(FrameTask(get_element_array(frame.elements), bounds, scale, size, path))
+                    written.append(path)
+            else:
+                columns = options.columns or max(1, math.ceil(math.sqrt(len(anim.frames))))
+                rows = max(1, math.ceil(len(anim.frames) / columns))
+                step_x, step_y = size[0] + options.padding, size[1] + options.padding
+                sheet_size = (columns * step_x - options.padding, rows * step_y - options.padding)
+                sheet = (shared.create(sheet_size).name, "RGBA", sheet_size)
+                info = SheetInfo(name + ".png", anim.anim_name, anim.frame_rate, anim.looping, bounds, scale)
+                for i, frame in enumerate(anim.frames):
+                    position = ((i % columns) * step_x, (i // columns) * step_y)
+                    info.frames.append(SheetFrame(position[0], position[1], size[0], size[1]))
+                    tasks.append(FrameTask(get_element_array(frame.elements), bounds, scale, size, sheet=sheet, position=position))
+                sheets.append((info, sheet, name))
+
+        if jobs == 1 or len(tasks) <= 1:
+            # Nothing to share, so the images are used as they are
+            global worker_renderer, worker_options
+            worker_renderer, worker_options = renderer, options
+            worker_blocks.update((block.name, block) for block in shared.blocks)
+            try:
+                render_tasks(tasks)
+            finally:
+                worker_renderer = None
+                worker_blocks.clear()
+        else:
+            for material in build.materials:
+                shared.add(material.image)
+            jobs = jobs or os.cpu_count() or 1
+            # A few chunks per worker, so work stays balanced while each chunk reuses the worker's crops
+            chunk_size = max(1, math.ceil(len(tasks) / (jobs * 4)))
+            chunks = [tasks[i:i + chunk_size] for i in range(0, len(tasks), chunk_size)]
+            with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(strip_build(build), shared.infos, options)) as executor:
+                for _ in executor.map(render_tasks, chunks):
+                    pass
+
+        for info, (block_name, mode, sheet_size), name in sheets:
+            block = next(block for block in shared.blocks if block.name == block_name)
+            path = os.path.join(output_folder, name + ".png")
+            Image.fromarray(get_shared_array(block, sheet_size).copy(), mode).save(path, "PNG")
+            json_path = os.path.join(output_folder, name + ".json")
+            with open(json_path, "w") as json_file:
+                json.dump(asdict(info), json_file, indent=2)
+            written += [path, json_path]
+    return written
@@ -0,0 +1,174 @@
+from dataclasses import dataclass, field
+from typing import BinaryIO, Optional
+import numpy as np
+
+from source.model.ganim_format import *
+from source.model.ganim_io import GriftAnimIO, ANIM_STRING, ANIM_HEADER_STRUCT, ANIM_DATA_STRUCT, ANIM_FRAME_STRUCT, ANIM_ELEMENT_STRUCT
+from source.model.file_io import BufferReader, WrongFormatException
+
+# Same layout as an element record in anim.bin, so runs of elements can be loaded with np.frombuffer
+ELEMENT_DTYPE = np.dtype([
+    ("symbol_hash", "<u4"),
+    ("frame", "<u4"),
+    ("folder_hash", "<u4"),
+    ("c_ap", "<f4"), ("c_bp", "<f4"), ("c_gp", "<f4"), ("c_rp", "<f4"),
+    ("c_aa", "<f4"), ("c_ba", "<f4"), ("c_ga", "<f4"), ("c_ra", "<f4"),
+    ("mat_a", "<f4"), ("mat_b", "<f4"), ("mat_c", "<f4"), ("mat_d", "<f4"),
+    ("tx", "<f4"), ("ty", "<f4"),
+    ("tz", "<f4"),
+])
+assert ELEMENT_DTYPE.itemsize == ANIM_ELEMENT_STRUCT.size
+
+# element_start is relative to the elements of the anim that the frame belongs to
+FRAME_DTYPE = np.dtype([
+    ("pos_x", "<f4"), ("pos_y", "<f4"),
+    ("size_x", "<f4"), ("size_y", "<f4"),
+    ("element_start", "<i8"),
+    ("element_count", "<i8"),
+])
+
+@dataclass
+class ColumnarAnimData:
+    anim_name: str = ""
+    root_symbol: str = ""
+    frame_rate: float = 0.0
+    looping: bool = False
+    frames: np.ndarray = field(default_factory=lambda: np.zeros(0, FRAME_DTYPE))
+    # View into ColumnarAnimFile.elements
+    elements: np.ndarray = field(default_factory=lambda: np.zeros(0, ELEMENT_DTYPE))
+
+    @property
+    def num_frames(self) -> int:
+        return len(self.frames)
+
+    def get_frame_elements(self, index: int) -> np.ndarray:
+        start = int(self.frames["element_start"][index])
+        return self.elements[start:start + int(self.frames["element_count"][index])]
+
+    def get_frame(self, index: int, table: Optional[HasHashStrings] = None) -> AnimFrame:
+        pos_x, pos_y, size_x, size_y, _, _ = self.frames[index].tolist()
+        result = AnimFrame(Coord(pos_x, pos_y), Coord(size_x, size_y))
+        result.elements = [GriftAnimIO.make_anim_element(values, table) for values in self.get_frame_elements(index).tolist()]
+        return result
+
+    def to_anim_data(self, table: Optional[HasHashStrings] = None) -> AnimData:
+        result = AnimData(self.anim_name, self.root_symbol, self.frame_rate, self.looping)
+        result.frames = [self.get_frame(i, table) for i in range(self.num_frames)]
+        return result
+
+@dataclass
+class ColumnarAnimFile:
+    version: int = ANIM_VERSION
+    num_element_refs: int = 0
+    num_frames: int = 0
+    anims: list[ColumnarAnimData] = field(default_factory=list)
+    # Elements of every frame of every anim, in file order
+    elements: np.ndarray = field(default_factory=lambda: np.zeros(0, ELEMENT_DTYPE))
+    hashed_strings: dict[int, str] = field(default_factory=dict)
+    def get_hash_string(self, hash_val: int) -> str:
+        return self.hashed_strings[hash_val]
+
+    def get_anim(self, anim_name: str) -> ColumnarAnimData:
+        for anim in self.anims:
+            if anim.anim_name == anim_name:
+                return anim
+        raise KeyError(anim_name)
+
+    # Convert a single anim to the dataclass representation
+    # The HashRefs point to this columnar file, which provides the same hash strings
+    def get_anim_data(self, index: int) -> AnimData:
+        return self.anims[index].to_anim_data(self)
+
+    def to_anim_file(self) -> AnimFile:
+        result = AnimFile(self.version, self.num_element_refs, self.num_frames)
+        result.hashed_strings = dict(self.hashed_strings)
+        result.anims = [anim.to_anim_data(result) for anim in self.anims]
+        return result
+
+    @staticmethod
+    def from_anim_file(anim_file: AnimFile) -> 'ColumnarAnimFile':
+        result = ColumnarAnimFile(anim_file.version, anim_file.num_element_refs, anim_file.num_frames)
+        result.hashed_strings = dict(anim_file.hashed_strings)
+        element_rows: list[tuple] = []
+        anim_ranges: list[tuple[int, int]] = []
+        for anim in anim_file.anims:
+            anim_start = len(element_rows)
+            frames = np.zeros(len(anim.frames), FRAME_DTYPE)
+            for i, frame in enumerate(anim.frames):
+                frames[i] = (frame.pos.x, frame.pos.y, frame.size.x, frame.size.y, len(element_rows) - anim_start, len(frame.elements))
+                for e in frame.elements:
+                    element_rows.append((e.symbol_hash.hash_val, e.frame, e.folder_hash.hash_val,
+                        e.c_ap, e.c_bp, e.c_gp, e.c_rp, e.c_aa, e.c_ba, e.c_ga, e.c_ra,
+                        e.mat_a, e.mat_b, e.mat_c, e.mat_d, e.tx, e.ty, e.tz))
+            anim_ranges.append((anim_start, len(element_rows)))
+            result.anims.append(ColumnarAnimData(anim.anim_name, anim.root_symbol, anim.frame_rate, anim.looping, frames))
+        result.elements = np.array(element_rows, ELEMENT_DTYPE)
+        for anim, (start, end) in zip(result.anims, anim_ranges):
+            anim.elements = result.elements[start:end]
+        return result
+
+    # Load directly from the binary layout of anim.bin. Element records are copied out of
+    # the buffer with np.frombuffer, one contiguous run per frame
+    @staticmethod
+    def parse(reader: BufferReader) -> 'ColumnarAnimFile':
+        GriftAnimIO.parse_header(reader, ANIM_STRING)
+        result = ColumnarAnimFile()
+        result.version = GriftAnimIO.parse_int(reader)
+        if result.version != ANIM_VERSION:
+            raise WrongFormatException("Invalid version")
+        result.num_element_refs, result.num_frames, num_anims = reader.unpack(ANIM_HEADER_STRUCT)
+        # (byte offset, element count) of every frame's element run, in file order
+        runs: list[tuple[int, int]] = []
+        anim_ranges: list[tuple[int, int]] = []
+        total_elements = 0
+        for _ in range(num_anims):
+            anim = ColumnarAnimData()
+            anim.anim_name = GriftAnimIO.parse_str(reader)
+            anim.root_symbol = GriftAnimIO.parse_str(reader)
+            anim.frame_rate, looping, num_f = reader.unpack(ANIM_DATA_STRUCT)
+            anim.looping = bool(looping)
+            anim.frames = np.zeros(num_f, FRAME_DTYPE)
+            anim_start = total_elements
+            for i in range(num_f):
+                pos_x, pos_y, size_x, size_y, num_e = reader.unpack(ANIM_FRAME_STRUCT)
+                anim.frames[i] = (pos_x, pos_y, size_x, size_y, total_elements - anim_start, num_e)
+                runs.append((reader.offset, num_e))
+                reader.skip(num_e * ELEMENT_DTYPE.itemsize)
+                total_elements += num_e
+            anim_ranges.append((anim_start, total_elements))
+            result.anims.append(anim)
+        result.hashed_strings = GriftAnimIO.parse_hashed_strings(reader)
+        if not reader.at_end():
+            raise WrongFormatException("End of file not reached")
+
+        result.elements = np.empty(total_elements, ELEMENT_DTYPE)
+        start = 0
+        for offset, count in runs:
+            result.elements[start:start + count] = np.frombuffer(reader.view, ELEMENT_DTYPE, count, offset)
+            start += count
+        for anim, (start, end) in zip(result.anims, anim_ranges):
+            anim.elements = result.elements[start:end]
+        return result
+
+    @staticmethod
+    def read(file: BinaryIO) -> 'ColumnarAnimFile':
+        with BufferReader(file.read()) as reader:
+            return ColumnarAnimFile.parse(reader)
+
+    @staticmethod
+    def read_path(path: str) -> 'ColumnarAnimFile':
+        with GriftAnimIO.map_file(path) as reader:
+            return ColumnarAnimFile.parse(reader)
+
+    def write(self, file: BinaryIO) -> None:
+        GriftAnimIO.write_str(file, ANIM_STRING, False)
+        GriftAnimIO.write_int(file, ANIM_VERSION)
+        file.write(ANIM_HEADER_STRUCT.pack(self.num_element_refs, self.num_frames, len(self.anims)))
+        for anim in self.anims:
+            GriftAnimIO.write_str(file, anim.anim_name)
+            GriftAnimIO.write_str(file, anim.root_symbol)
+            file.write(ANIM_DATA_STRUCT.pack(anim.frame_rate, 1 if anim.looping else 0, anim.num_frames))
+            for i, (pos_x, pos_y, size_x, size_y, _, num_e) in enumerate(anim.frames.tolist()):
+                file.write(ANIM_FRAME_STRUCT.pack(pos_x, pos_y, size_x, size_y, num_e))
+                file.write(anim.get_frame_elements(i).tobytes())
+        GriftAnimIO.write_hashed_strings(file, self.hashed_strings)
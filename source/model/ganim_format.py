@@ -1,6 +1,8 @@
+from bisect import bisect_right
 from dataclasses import dataclass, field
 from PIL import Image
 from typing import Optional, Protocol
+
 BUILD_VERSION = 10
 ANIM_VERSION = 7
 
@@ -65,6 +67,27 @@ class BuildMaterial:
     path: str = ""
     image: Optional[Image.Image] = None
 
+# The frames of a symbol ordered by frame_num, to find the one shown at a frame number by bisection
+@dataclass
+class SymbolFrames:
+    symbol: BuildSymbol
+    starts: list[int] = field(default_factory=list)
+    frames: list[BuildFrame] = field(default_factory=list)
+
+    @staticmethod
+    def from_symbol(symbol: BuildSymbol) -> 'SymbolFrames':
+        frames = sorted(symbol.frames, key=lambda frame: frame.frame_num)
+        return SymbolFrames(symbol, [frame.frame_num for frame in frames], frames)
+
+    # The frame covering n, the one with frame.frame_num <= n < frame.frame_num + frame.duration
+    # None if no frame covers it, like in a gap between frames or before the first one
+    def get_frame(self, n: int) -> Optional[BuildFrame]:
+        index = bisect_right(self.starts, n) - 1
+        if index < 0:
+            return None
+        frame = self.frames[index]
+        return frame if n < frame.frame_num + frame.duration else None
+
 @dataclass
 class BuildFile:
     version: int = BUILD_VERSION
@@ -74,9 +97,33 @@ class BuildFile:
     sdf_materials: list[str] = field(default_factory=list)
     symbols: list[BuildSymbol] = field(default_factory=list)
     hashed_strings: dict[int, str] = field(default_factory=dict)
+    # Symbols by hash, built when first needed. Call invalidate_index after changing symbols or their frames
+    _symbol_index: Optional[dict[int, SymbolFrames]] = field(default=None, init=False, compare=False, repr=False)
     def get_hash_string(self, hash_val: int) -> str:
         return self.hashed_strings[hash_val]
 
+    def get_symbol_index(self) -> dict[int, SymbolFrames]:
+        if self._symbol_index is None:
+            index: dict[int, SymbolFrames] = {}
+            for symbol in self.symbols:
+                # Like a scan of symbols, the first symbol with a hash is the one found
+                if symbol.symbol_hash.hash_val not in index:
+                    index[symbol.symbol_hash.hash_val] = SymbolFrames.from_symbol(symbol)
+            self._symbol_index = index
+        return self._symbol_index
+
+    def invalidate_index(self) -> None:
+        self._symbol_index = None
+
+    def get_symbol(self, symbol_hash: int) -> Optional[BuildSymbol]:
+        entry = self.get_symbol_index().get(symbol_hash)
+        return entry and entry.symbol
+
+    # The frame of a symbol shown at frame_num, or None if the build doesn't have the symbol (or none of its frames covers frame_num)
+    def get_symbol_frame(self, symbol_hash: int, frame_num: int) -> Optional[BuildFrame]:
+        entry = self.get_symbol_index().get(symbol_hash)
+        return entry and entry.get_frame(frame_num)
+
 @dataclass
 class AnimElement:
     symbol_hash: HashRef = field(default_factory=HashRef)
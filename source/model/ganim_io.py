@@ -1,14 +1,39 @@
-from typing import BinaryIO, Any
+from typing import BinaryIO, Any, Iterator, Optional
 from source.model.ganim_format import *
-from source.model.file_io import AnimFileIO, WrongFormatException
-from source.model.image_format import read_image, write_image
-from struct import pack, unpack, calcsize
-import os
+from source.model.ganim_lazy_build import LazyBuildMaterial
+from source.model.file_io import AnimFileIO, WrongFormatException, BufferReader, BufferWriter
+from source.model.anim_source import AnimSource, FolderSource, open_anim_source
+from source.model.image_format import read_image
+from source.model.texture_cache import read_cached_image
+from source.model.image_export import ImageExporter
+from struct import pack, unpack, calcsize, Struct
+from contextlib import contextmanager
+import os, mmap
 
 ENCODING = "utf-8"
 BUILD_STRING = "BILD"
 ANIM_STRING = "ANIM"
 
+INT_STRUCT = Struct("<I")
+FLOAT_STRUCT = Struct("<f")
+# hash_val, string length (followed by the string)
+HASHED_STRING_STRUCT = Struct("<2I")
+# Precompiled layouts of the fixed-size records, in on-disk order
+# symbol_hash, color_channel_hash, looping, num_frames
+BUILD_SYMBOL_STRUCT = Struct("<4I")
+# frame_num, duration, image_index, bbox (x, y, w, h), uv0 (x, y), uv1 (x, y)
+BUILD_FRAME_STRUCT = Struct("<3I8f")
+# total_symbols, total_frames (after the version)
+BUILD_HEADER_STRUCT = Struct("<2I")
+# num_element_refs, num_frames, num_anims (after the version)
+ANIM_HEADER_STRUCT = Struct("<3I")
+# frame_rate, looping, num_frames
+ANIM_DATA_STRUCT = Struct("<f2I")
+# pos (x, y), size (x, y), num_elements
+ANIM_FRAME_STRUCT = Struct("<4fI")
+# symbol_hash, frame, folder_hash, c_ap ... c_ra, mat_a ... mat_d, tx, ty, tz
+ANIM_ELEMENT_STRUCT = Struct("<3I15f")
+
 class GriftAnimIO(AnimFileIO):
     ### Some general methods for I/O
     @staticmethod
@@ -21,6 +46,19 @@ class GriftAnimIO(AnimFileIO):
 
         return unpack(fmt, val)[0]
 
+    @staticmethod
+    def read_bytes(file: BinaryIO, size: int) -> bytes:
+        val = file.read(size)
+
+        if size != len(val):
+            raise EOFError("EOF reached")
+
+        return val
+
+    @staticmethod
+    def read_struct(file: BinaryIO, struct: Struct) -> tuple[Any, ...]:
+        return struct.unpack(GriftAnimIO.read_bytes(file, struct.size))
+
     @staticmethod
     def read_int(file: BinaryIO) -> int:
         return GriftAnimIO.read(file, "<I")
@@ -40,12 +78,17 @@ class GriftAnimIO(AnimFileIO):
         if size is None:
             size = GriftAnimIO.read_int(file)
         assert(size is not None)
-        output = b""
-
-        for _ in range(size):
-            output += GriftAnimIO.read(file, "s")
+        return GriftAnimIO.read_bytes(file, size).decode(ENCODING)
 
-        return output.decode(ENCODING)
+    # The hashed string table is the last section of both build.bin and anim.bin,
+    # so the rest of the file is read at once and decoded from memory
+    @staticmethod
+    def read_hashed_strings(file: BinaryIO) -> dict[int, str]:
+        with BufferReader(file.read()) as reader:
+            result = GriftAnimIO.parse_hashed_strings(reader)
+            if not reader.at_end():
+                raise WrongFormatException("End of file not reached")
+        return result
 
     @staticmethod
     def write(file: BinaryIO, fmt: str, obj: Any) -> None:
@@ -66,13 +109,48 @@ class GriftAnimIO(AnimFileIO):
 
     @staticmethod
     def write_str(file: BinaryIO, val: str, include_size = True) -> None:
+        file.write(GriftAnimIO.encode_str(val, include_size))
+
+    # Encode a string as (int, string), or just the string if include_size is False
+    @staticmethod
+    def encode_str(val: str, include_size = True) -> bytes:
+        data = val.encode(ENCODING)
         if include_size:
-            GriftAnimIO.write_int(file, len(val))
-        for b in val:
-            GriftAnimIO.write(file, "s", bytes(b, ENCODING))
+            return INT_STRUCT.pack(len(data)) + data
+        return data
+
+    @staticmethod
+    def encode_hashed_strings(hashed_strings: dict[int, str]) -> bytes:
+        chunks = [INT_STRUCT.pack(len(hashed_strings))]
+        for hash_val, hash_str in hashed_strings.items():
+            chunks.append(INT_STRUCT.pack(hash_val))
+            chunks.append(GriftAnimIO.encode_str(hash_str))
+        return b"".join(chunks)
+
+    @staticmethod
+    def write_hashed_strings(file: BinaryIO, hashed_strings: dict[int, str]) -> None:
+        file.write(GriftAnimIO.encode_hashed_strings(hashed_strings))
 
     ### Methods for reading the build file
 
+    # If lazy_images is set, the image is only read when the material's image is first accessed
+    # Images of files on disk are shared with the texture cache, so they must not be edited in place
+    @staticmethod
+    def load_material(folder: str | AnimSource, material_name: str, lazy_images: bool = False) -> BuildMaterial:
+        if isinstance(folder, str):
+            folder = FolderSource(folder)
+        image_path = folder.get_path(material_name)
+        if image_path is not None:
+            if lazy_images:
+                return LazyBuildMaterial(material_name, image_path)
+            return BuildMaterial(material_name, read_cached_image(image_path, copy=False))
+        if lazy_images:
+            return LazyBuildMaterial(material_name, material_name, source=folder)
+        with folder.open(material_name) as file:
+            image = read_image(file, os.path.splitext(material_name)[1])
+            image.load()
+        return BuildMaterial(material_name, image)
+
     @staticmethod
     def read_build_frame(file: BinaryIO) -> BuildFrame:
         result = BuildFrame()
@@ -89,22 +167,29 @@ class GriftAnimIO(AnimFileIO):
         result.uv1.y = GriftAnimIO.read_float(file)
         return result
 
+    @staticmethod
+    def make_build_frame(values: tuple[Any, ...]) -> BuildFrame:
+        frame_num, duration, image_index, x, y, w, h, u0x, u0y, u1x, u1y = values
+        return BuildFrame(frame_num, duration, image_index, BBox(Coord(x, y), Coord(w, h)), Coord(u0x, u0y), Coord(u1x, u1y))
+
+    # Read a run of consecutive build frames with a single read
+    @staticmethod
+    def read_build_frames(file: BinaryIO, count: int) -> list[BuildFrame]:
+        data = GriftAnimIO.read_bytes(file, BUILD_FRAME_STRUCT.size * count)
+        return [GriftAnimIO.make_build_frame(values) for values in BUILD_FRAME_STRUCT.iter_unpack(data)]
+
     @staticmethod
     def read_build_symbol(file: BinaryIO, build_file: BuildFile) -> BuildSymbol:
-        result = BuildSymbol()
-        result.symbol_hash = HashRef(GriftAnimIO.read_int(file), build_file)
-        result.color_channel_hash = HashRef(GriftAnimIO.read_int(file), build_file)
-        result.looping = GriftAnimIO.read_bool(file)
-        num_frames = GriftAnimIO.read_int(file)
-        for _ in range(num_frames):
-            result.frames.append(GriftAnimIO.read_build_frame(file))
+        symbol_hash, color_channel_hash, looping, num_frames = GriftAnimIO.read_struct(file, BUILD_SYMBOL_STRUCT)
+        result = BuildSymbol(HashRef(symbol_hash, build_file), HashRef(color_channel_hash, build_file), bool(looping))
+        result.frames = GriftAnimIO.read_build_frames(file, num_frames)
         return result
 
     @staticmethod
-    def read_build_file(file: BinaryIO, folder_path: str) -> BuildFile:
+    def read_build_file(file: BinaryIO, folder_path: str | AnimSource, lazy_images: bool = False) -> BuildFile:
         header = file.read(len(BUILD_STRING)).decode("utf-8")
         if header != BUILD_STRING:
-            raise WrongFormatException("Header must be {BUILD_STRING}")
+            raise WrongFormatException(f"Header must be {BUILD_STRING}")
         result = BuildFile()
         result.version = GriftAnimIO.read_int(file)
         if result.version == BUILD_VERSION:
@@ -114,25 +199,41 @@ class GriftAnimIO(AnimFileIO):
             num_materials = GriftAnimIO.read_int(file)
             for _ in range(num_materials):
                 material_name = GriftAnimIO.read_str(file)
-                image = read_image(os.path.join(folder_path, material_name))
-                result.materials.append(BuildMaterial(material_name, image))
+                result.materials.append(GriftAnimIO.load_material(folder_path, material_name, lazy_images))
             num_sdf_materials = GriftAnimIO.read_int(file)
             for _ in range(num_sdf_materials):
                 result.sdf_materials.append(GriftAnimIO.read_str(file))
             for _ in range(total_symbols):
                 result.symbols.append(GriftAnimIO.read_build_symbol(file, result))
-            num_hashed_strings = GriftAnimIO.read_int(file)
-            for _ in range(num_hashed_strings):
-                hash_val = GriftAnimIO.read_int(file)
-                hash_str = GriftAnimIO.read_str(file)
-                result.hashed_strings[hash_val] = hash_str
-            if file.read(1):
-                raise WrongFormatException("End of file not reached")
+            result.hashed_strings = GriftAnimIO.read_hashed_strings(file)
             return result
         raise WrongFormatException("Invalid version")
 
     ### Methods for writing the build file
 
+    @staticmethod
+    def add_material(exporter: ImageExporter, folder_path: str, material: BuildMaterial) -> None:
+        path = os.path.join(folder_path, material.path)
+        if isinstance(material, LazyBuildMaterial) and not material.loaded and not material.assigned:
+            # The image was never loaded, so the file it comes from is still up to date
+            if material.source is not None:
+                exporter.add_copy(path, material.open_file)
+            elif os.path.abspath(path) != os.path.abspath(material.image_path):
+                image_path = material.image_path
+                exporter.add_copy(path, lambda: open(image_path, "rb"))
+            return
+        if material.image:
+            exporter.add_image(path, material.image)
+
+    # Encode the material images on a pool of threads. Nothing is written until the exporter's write() is called
+    @staticmethod
+    def encode_materials(folder_path: str, build: BuildFile, max_workers: Optional[int] = None) -> ImageExporter:
+        exporter = ImageExporter(max_workers)
+        for material in build.materials:
+            GriftAnimIO.add_material(exporter, folder_path, material)
+        exporter.encode()
+        return exporter
+
     @staticmethod
     def write_build_frame(file: BinaryIO, frame: BuildFrame) -> None:
         GriftAnimIO.write_int(file, frame.frame_num)
@@ -157,26 +258,47 @@ class GriftAnimIO(AnimFileIO):
             GriftAnimIO.write_build_frame(file, frame)
 
     @staticmethod
-    def write_build_file(file: BinaryIO, folder_path: str, build: BuildFile) -> None:
-        GriftAnimIO.write_str(file, BUILD_STRING, False)
-        GriftAnimIO.write_int(file, BUILD_VERSION)
-        GriftAnimIO.write_int(file, len(build.symbols))
-        GriftAnimIO.write_int(file, build.total_frames)
-        GriftAnimIO.write_str(file, build.build_name)
-        GriftAnimIO.write_int(file, len(build.materials))
+    # The binary is only written once every material is encoded. exporter holds materials that were already encoded
+    def write_build_file(file: BinaryIO, folder_path: str, build: BuildFile, exporter: Optional[ImageExporter] = None) -> None:
+        with exporter or GriftAnimIO.encode_materials(folder_path, build) as exporter:
+            with BufferWriter(file) as writer:
+                GriftAnimIO.pack_build_file(writer, build)
+            exporter.write()
+
+    # Serialize the build to bytes. Material images are only written if folder_path is given
+    @staticmethod
+    def encode_build_file(build: BuildFile, folder_path: Optional[str] = None) -> bytes:
+        writer = BufferWriter()
+        if folder_path is not None:
+            with GriftAnimIO.encode_materials(folder_path, build) as exporter:
+                GriftAnimIO.pack_build_file(writer, build)
+                exporter.write()
+        else:
+            GriftAnimIO.pack_build_file(writer, build)
+        return writer.getvalue()
+
+    @staticmethod
+    def build_frame_values(frame: BuildFrame) -> tuple[Any, ...]:
+        return (frame.frame_num, frame.duration, frame.image_index,
+            frame.bbox.pos.x, frame.bbox.pos.y, frame.bbox.size.x, frame.bbox.size.y,
+            frame.uv0.x, frame.uv0.y, frame.uv1.x, frame.uv1.y)
+
+    @staticmethod
+    def pack_build_file(writer: BufferWriter, build: BuildFile) -> None:
+        writer.write(GriftAnimIO.encode_str(BUILD_STRING, False))
+        writer.pack(INT_STRUCT, BUILD_VERSION)
+        writer.pack(BUILD_HEADER_STRUCT, len(build.symbols), build.total_frames)
+        writer.write(GriftAnimIO.encode_str(build.build_name))
+        writer.pack(INT_STRUCT, len(build.materials))
         for material in build.materials:
-            GriftAnimIO.write_str(file, material.path)
-            if material.image:
-                write_image(os.path.join(folder_path, material.path), material.image)
-        GriftAnimIO.write_int(file, len(build.sdf_materials))
-        for material in build.sdf_materials:
-            GriftAnimIO.write_str(file, material)
+            writer.write(GriftAnimIO.encode_str(material.path))
+        writer.pack(INT_STRUCT, len(build.sdf_materials))
+        for sdf_material in build.sdf_materials:
+            writer.write(GriftAnimIO.encode_str(sdf_material))
         for symbol in build.symbols:
-            GriftAnimIO.write_build_symbol(file, symbol)
-        GriftAnimIO.write_int(file, len(build.hashed_strings))
-        for hash_val in build.hashed_strings:
-            GriftAnimIO.write_int(file, hash_val)
-            GriftAnimIO.write_str(file, build.hashed_strings[hash_val])
+            writer.pack(BUILD_SYMBOL_STRUCT, symbol.symbol_hash.hash_val, symbol.color_channel_hash.hash_val, 1 if symbol.looping else 0, len(symbol.frames))
+            writer.pack_records(BUILD_FRAME_STRUCT, [GriftAnimIO.build_frame_values(frame) for frame in symbol.frames])
+        writer.write(GriftAnimIO.encode_hashed_strings(build.hashed_strings))
 
     @staticmethod
     def read_anim_element(file: BinaryIO, anim_file: AnimFile) -> AnimElement:
@@ -205,16 +327,22 @@ class GriftAnimIO(AnimFileIO):
 
         return result
 
+    @staticmethod
+    def make_anim_element(values: tuple[Any, ...], table: Optional[HasHashStrings]) -> AnimElement:
+        symbol_hash, frame, folder_hash, *floats = values
+        return AnimElement(HashRef(symbol_hash, table), frame, HashRef(folder_hash, table), *floats)
+
+    # Read a run of consecutive anim elements with a single read
+    @staticmethod
+    def read_anim_elements(file: BinaryIO, count: int, anim_file: AnimFile) -> list[AnimElement]:
+        data = GriftAnimIO.read_bytes(file, ANIM_ELEMENT_STRUCT.size * count)
+        return [GriftAnimIO.make_anim_element(values, anim_file) for values in ANIM_ELEMENT_STRUCT.iter_unpack(data)]
+
     @staticmethod
     def read_anim_frame(file: BinaryIO, anim_file: AnimFile) -> AnimFrame:
-        result = AnimFrame()
-        result.pos.x = GriftAnimIO.read_float(file)
-        result.pos.y = GriftAnimIO.read_float(file)
-        result.size.x = GriftAnimIO.read_float(file)
-        result.size.y = GriftAnimIO.read_float(file)
-        num_e = GriftAnimIO.read_int(file)
-        for _ in range(num_e):
-            result.elements.append(GriftAnimIO.read_anim_element(file, anim_file))
+        x, y, w, h, num_e = GriftAnimIO.read_struct(file, ANIM_FRAME_STRUCT)
+        result = AnimFrame(Coord(x, y), Coord(w, h))
+        result.elements = GriftAnimIO.read_anim_elements(file, num_e, anim_file)
         return result
 
     @staticmethod
@@ -233,7 +361,7 @@ class GriftAnimIO(AnimFileIO):
     def read_anim_file(file: BinaryIO) -> AnimFile:
         header = file.read(len(ANIM_STRING)).decode("utf-8")
         if header != ANIM_STRING:
-            raise WrongFormatException("Header must be {ANIM_STRING}")
+            raise WrongFormatException(f"Header must be {ANIM_STRING}")
         result = AnimFile()
         result.version = GriftAnimIO.read_int(file)
         if result.version == ANIM_VERSION:
@@ -242,13 +370,7 @@ class GriftAnimIO(AnimFileIO):
             num_anims = GriftAnimIO.read_int(file)
             for _ in range(num_anims):
                 result.anims.append(GriftAnimIO.read_anim_data(file, result))
-            num_strings = GriftAnimIO.read_int(file)
-            for _ in range(num_strings):
-                hash_val = GriftAnimIO.read_int(file)
-                hash_str = GriftAnimIO.read_str(file)
-                result.hashed_strings[hash_val] = hash_str
-            if file.read(1):
-                raise WrongFormatException("End of file not reached")
+            result.hashed_strings = GriftAnimIO.read_hashed_strings(file)
             return result
         raise WrongFormatException("Invalid version")
 
@@ -298,29 +420,169 @@ class GriftAnimIO(AnimFileIO):
 
     @staticmethod
     def write_anim_file(file: BinaryIO, anim: AnimFile) -> None:
-        GriftAnimIO.write_str(file, ANIM_STRING, False)
-        GriftAnimIO.write_int(file, ANIM_VERSION)
-        GriftAnimIO.write_int(file, anim.num_element_refs)
-        GriftAnimIO.write_int(file, anim.num_frames)
-        GriftAnimIO.write_int(file, len(anim.anims))
+        with BufferWriter(file) as writer:
+            GriftAnimIO.pack_anim_file(writer, anim)
+
+    @staticmethod
+    def encode_anim_file(anim: AnimFile) -> bytes:
+        writer = BufferWriter()
+        GriftAnimIO.pack_anim_file(writer, anim)
+        return writer.getvalue()
+
+    @staticmethod
+    def anim_element_values(element: AnimElement) -> tuple[Any, ...]:
+        return (element.symbol_hash.hash_val, element.frame, element.folder_hash.hash_val,
+            element.c_ap, element.c_bp, element.c_gp, element.c_rp,
+            element.c_aa, element.c_ba, element.c_ga, element.c_ra,
+            element.mat_a, element.mat_b, element.mat_c, element.mat_d,
+            element.tx, element.ty, element.tz)
+
+    @staticmethod
+    def pack_anim_file(writer: BufferWriter, anim: AnimFile) -> None:
+        writer.write(GriftAnimIO.encode_str(ANIM_STRING, False))
+        writer.pack(INT_STRUCT, ANIM_VERSION)
+        writer.pack(ANIM_HEADER_STRUCT, anim.num_element_refs, anim.num_frames, len(anim.anims))
         for one_anim in anim.anims:
-            GriftAnimIO.write_anim_data(file, one_anim)
-        GriftAnimIO.write_int(file, len(anim.hashed_strings))
-        for hash_val in anim.hashed_strings:
-            GriftAnimIO.write_int(file, hash_val)
-            GriftAnimIO.write_str(file, anim.hashed_strings[hash_val])
+            writer.write(GriftAnimIO.encode_str(one_anim.anim_name))
+            writer.write(GriftAnimIO.encode_str(one_anim.root_symbol))
+            writer.pack(ANIM_DATA_STRUCT, one_anim.frame_rate, 1 if one_anim.looping else 0, len(one_anim.frames))
+            for frame in one_anim.frames:
+                writer.pack(ANIM_FRAME_STRUCT, frame.pos.x, frame.pos.y, frame.size.x, frame.size.y, len(frame.elements))
+                writer.pack_records(ANIM_ELEMENT_STRUCT, [GriftAnimIO.anim_element_values(element) for element in frame.elements])
+        writer.write(GriftAnimIO.encode_hashed_strings(anim.hashed_strings))
+
+    ### Methods for parsing from an in-memory or memory-mapped buffer
+
+    @staticmethod
+    def parse_int(reader: BufferReader) -> int:
+        return reader.unpack(INT_STRUCT)[0]
+
+    @staticmethod
+    def parse_str(reader: BufferReader) -> str:
+        return reader.read_str(GriftAnimIO.parse_int(reader), ENCODING)
+
+    @staticmethod
+    def parse_header(reader: BufferReader, header: str) -> None:
+        if reader.remaining() < len(header) or reader.read_str(len(header), ENCODING) != header:
+            raise WrongFormatException(f"Header must be {header}")
+
+    @staticmethod
+    def parse_hashed_strings(reader: BufferReader) -> dict[int, str]:
+        result: dict[int, str] = {}
+        num_strings = GriftAnimIO.parse_int(reader)
+        for _ in range(num_strings):
+            hash_val, size = reader.unpack(HASHED_STRING_STRUCT)
+            result[hash_val] = reader.read_str(size, ENCODING)
+        return result
+
+    @staticmethod
+    def parse_build_symbol(reader: BufferReader, build_file: BuildFile) -> BuildSymbol:
+        symbol_hash, color_channel_hash, looping, num_frames = reader.unpack(BUILD_SYMBOL_STRUCT)
+        result = BuildSymbol(HashRef(symbol_hash, build_file), HashRef(color_channel_hash, build_file), bool(looping))
+        result.frames = reader.unpack_records(BUILD_FRAME_STRUCT, num_frames, GriftAnimIO.make_build_frame)
+        return result
+
+    @staticmethod
+    def parse_build_file(reader: BufferReader, folder_path: str | AnimSource, lazy_images: bool = False) -> BuildFile:
+        GriftAnimIO.parse_header(reader, BUILD_STRING)
+        result = BuildFile()
+        result.version = GriftAnimIO.parse_int(reader)
+        if result.version == BUILD_VERSION:
+            total_symbols, result.total_frames = reader.unpack(BUILD_HEADER_STRUCT)
+            result.build_name = GriftAnimIO.parse_str(reader)
+            num_materials = GriftAnimIO.parse_int(reader)
+            for _ in range(num_materials):
+                material_name = GriftAnimIO.parse_str(reader)
+                result.materials.append(GriftAnimIO.load_material(folder_path, material_name, lazy_images))
+            num_sdf_materials = GriftAnimIO.parse_int(reader)
+            for _ in range(num_sdf_materials):
+                result.sdf_materials.append(GriftAnimIO.parse_str(reader))
+            for _ in range(total_symbols):
+                result.symbols.append(GriftAnimIO.parse_build_symbol(reader, result))
+            result.hashed_strings = GriftAnimIO.parse_hashed_strings(reader)
+            if not reader.at_end():
+                raise WrongFormatException("End of file not reached")
+            return result
+        raise WrongFormatException("Invalid version")
+
+    @staticmethod
+    def parse_anim_frame(reader: BufferReader, anim_file: AnimFile) -> AnimFrame:
+        x, y, w, h, num_e = reader.unpack(ANIM_FRAME_STRUCT)
+        result = AnimFrame(Coord(x, y), Coord(w, h))
+        result.elements = reader.unpack_records(ANIM_ELEMENT_STRUCT, num_e, lambda values: GriftAnimIO.make_anim_element(values, anim_file))
+        return result
+
+    @staticmethod
+    def parse_anim_data(reader: BufferReader, anim_file: AnimFile) -> AnimData:
+        result = AnimData()
+        result.anim_name = GriftAnimIO.parse_str(reader)
+        result.root_symbol = GriftAnimIO.parse_str(reader)
+        result.frame_rate, looping, num_f = reader.unpack(ANIM_DATA_STRUCT)
+        result.looping = bool(looping)
+        for _ in range(num_f):
+            result.frames.append(GriftAnimIO.parse_anim_frame(reader, anim_file))
+        return result
 
     @staticmethod
-    def read_animation(animation_folder: str) -> Animation:
+    def parse_anim_file(reader: BufferReader) -> AnimFile:
+        GriftAnimIO.parse_header(reader, ANIM_STRING)
+        result = AnimFile()
+        result.version = GriftAnimIO.parse_int(reader)
+        if result.version == ANIM_VERSION:
+            result.num_element_refs, result.num_frames, num_anims = reader.unpack(ANIM_HEADER_STRUCT)
+            for _ in range(num_anims):
+                result.anims.append(GriftAnimIO.parse_anim_data(reader, result))
+            result.hashed_strings = GriftAnimIO.parse_hashed_strings(reader)
+            if not reader.at_end():
+                raise WrongFormatException("End of file not reached")
+            return result
+        raise WrongFormatException("Invalid version")
+
+    # Memory-map a file and wrap it in a reader. The reader is released before the map is closed
+    @staticmethod
+    @contextmanager
+    def map_file(path: str) -> Iterator[BufferReader]:
+        with open(path, "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                # Empty files cannot be mapped
+                with BufferReader(b"") as reader:
+                    yield reader
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                with BufferReader(mapped) as reader:
+                    yield reader
+
+    # Memory-map a file of the source if it is on disk, otherwise read it into memory (e.g. a zip member)
+    @staticmethod
+    @contextmanager
+    def open_reader(source: AnimSource, name: str) -> Iterator[BufferReader]:
+        path = source.get_path(name)
+        if path is not None:
+            with GriftAnimIO.map_file(path) as reader:
+                yield reader
+        else:
+            with BufferReader(source.read_bytes(name)) as reader:
+                yield reader
+
+    # animation_folder can be a folder or a zip archive of the animation folder
+    @staticmethod
+    def read_animation(animation_folder: str, memory_map: bool = False, lazy_images: bool = False) -> Animation:
         result = Animation()
-        build_path = os.path.join(animation_folder, "build.bin")
-        anim_path = os.path.join(animation_folder, "anim.bin")
-        if os.path.isfile(build_path):
-            with open(build_path, "rb") as build_file:
-                result.build = GriftAnimIO.read_build_file(build_file, animation_folder)
-        if os.path.isfile(anim_path):
-            with open(anim_path, "rb") as anim_file:
-                result.anim = GriftAnimIO.read_anim_file(anim_file)
+        with open_anim_source(animation_folder) as source:
+            if source.exists("build.bin"):
+                if memory_map:
+                    with GriftAnimIO.open_reader(source, "build.bin") as reader:
+                        result.build = GriftAnimIO.parse_build_file(reader, source, lazy_images)
+                else:
+                    with source.open("build.bin") as build_file:
+                        result.build = GriftAnimIO.read_build_file(build_file, source, lazy_images)
+            if source.exists("anim.bin"):
+                if memory_map:
+                    with GriftAnimIO.open_reader(source, "anim.bin") as reader:
+                        result.anim = GriftAnimIO.parse_anim_file(reader)
+                else:
+                    with source.open("anim.bin") as anim_file:
+                        result.anim = GriftAnimIO.read_anim_file(anim_file)
         return result
 
     @staticmethod
@@ -328,8 +590,10 @@ class GriftAnimIO(AnimFileIO):
         if not os.path.exists(animation_folder):
             os.makedirs(animation_folder)
         if animation.build is not None:
-            with open(os.path.join(animation_folder, "build.bin"), "wb") as build_file:
-                GriftAnimIO.write_build_file(build_file, animation_folder, animation.build)
+            # Encode the materials before build.bin is opened, so a failed encode leaves the old files in place
+            with GriftAnimIO.encode_materials(animation_folder, animation.build) as exporter:
+                with open(os.path.join(animation_folder, "build.bin"), "wb") as build_file:
+                    GriftAnimIO.write_build_file(build_file, animation_folder, animation.build, exporter)
         if animation.anim is not None:
             with open(os.path.join(animation_folder, "anim.bin"), "wb") as anim_file:
                 GriftAnimIO.write_anim_file(anim_file, animation.anim)
@@ -0,0 +1,138 @@
+from dataclasses import dataclass, field
+from typing import Any, Optional
+import mmap, os
+
+from source.model.ganim_format import *
+from source.model.ganim_io import GriftAnimIO, ANIM_STRING, ANIM_HEADER_STRUCT, ANIM_DATA_STRUCT, ANIM_FRAME_STRUCT, ANIM_ELEMENT_STRUCT
+from source.model.file_io import BufferReader, WrongFormatException
+
+# Location of one anim inside anim.bin, built by the scan in LazyAnimFile
+@dataclass
+class AnimIndexEntry:
+    anim_name: str = ""
+    root_symbol: str = ""
+    frame_rate: float = 0.0
+    looping: bool = False
+    # Byte offset of the start of the anim record
+    offset: int = 0
+    # Byte offset of every frame record of the anim
+    frame_offsets: list[int] = field(default_factory=list)
+
+    @property
+    def num_frames(self) -> int:
+        return len(self.frame_offsets)
+
+# Read-only view of an anim.bin that only decodes anims (or frames of an anim) when they are requested
+# Opening it does a single scan over the frame headers, skipping the element records
+# HashRefs in decoded data point to this view, so keep it open while they are in use
+class LazyAnimFile:
+    def __init__(self, buffer: Any) -> None:
+        self._mapped: Optional[mmap.mmap] = None
+        self._reader = BufferReader(buffer)
+        self.version = ANIM_VERSION
+        self.num_element_refs = 0
+        self.num_frames = 0
+        self.entries: list[AnimIndexEntry] = []
+        self.index: dict[str, AnimIndexEntry] = {}
+        self.hashed_strings: dict[int, str] = {}
+        try:
+            self.__scan()
+        except Exception:
+            self._reader.release()
+            raise
+
+    @staticmethod
+    def open(path: str) -> 'LazyAnimFile':
+        with open(path, "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return LazyAnimFile(b"")
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            result = LazyAnimFile(mapped)
+        except Exception:
+            mapped.close()
+            raise
+        result._mapped = mapped
+        return result
+
+    def close(self) -> None:
+        self._reader.release()
+        if self._mapped is not None:
+            self._mapped.close()
+            self._mapped = None
+
+    def __enter__(self) -> 'LazyAnimFile':
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+    def __scan(self) -> None:
+        reader = self._reader
+        GriftAnimIO.parse_header(reader, ANIM_STRING)
+        self.version = GriftAnimIO.parse_int(reader)
+        if self.version != ANIM_VERSION:
+            raise WrongFormatException("Invalid version")
+        self.num_element_refs, self.num_frames, num_anims = reader.unpack(ANIM_HEADER_STRUCT)
+        for _ in range(num_anims):
+            entry = AnimIndexEntry(offset=reader.offset)
+            entry.anim_name = GriftAnimIO.parse_str(reader)
+            entry.root_symbol = GriftAnimIO.parse_str(reader)
+            entry.frame_rate, looping, num_f = reader.unpack(ANIM_DATA_STRUCT)
+            entry.looping = bool(looping)
+            for _ in range(num_f):
+                entry.frame_offsets.append(reader.offset)
+                num_e = reader.unpack(ANIM_FRAME_STRUCT)[-1]
+                reader.skip(num_e * ANIM_ELEMENT_STRUCT.size)
+            self.entries.append(entry)
+            # If names are duplicated, lookup by name finds the first one, like a linear search would
+            self.index.setdefault(entry.anim_name, entry)
+        self.hashed_strings = GriftAnimIO.parse_hashed_strings(reader)
+        if not reader.at_end():
+            raise WrongFormatException("End of file not reached")
+
+    def get_hash_string(self, hash_val: int) -> str:
+        return self.hashed_strings[hash_val]
+
+    @property
+    def anim_names(self) -> list[str]:
+        return [entry.anim_name for entry in self.entries]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, anim_name: str) -> bool:
+        return anim_name in self.index
+
+    def get_entry(self, anim: str | int) -> AnimIndexEntry:
+        if isinstance(anim, int):
+            return self.entries[anim]
+        return self.index[anim]
+
+    def get_frame(self, anim: str | int, frame_index: int) -> AnimFrame:
+        self._reader.offset = self.get_entry(anim).frame_offsets[frame_index]
+        return GriftAnimIO.parse_anim_frame(self._reader, self)
+
+    # Decode frames [start, stop) of an anim
+    def get_frames(self, anim: str | int, start: int = 0, stop: Optional[int] = None) -> list[AnimFrame]:
+        frame_offsets = self.get_entry(anim).frame_offsets[start:stop]
+        if not frame_offsets:
+            return []
+        # Frames are stored back to back, so the range is decoded in one pass
+        self._reader.offset = frame_offsets[0]
+        return [GriftAnimIO.parse_anim_frame(self._reader, self) for _ in frame_offsets]
+
+    def get_anim(self, anim: str | int) -> AnimData:
+        entry = self.get_entry(anim)
+        result = AnimData(entry.anim_name, entry.root_symbol, entry.frame_rate, entry.looping)
+        result.frames = self.get_frames(anim)
+        return result
+
+    # Decode everything into a regular AnimFile
+    def to_anim_file(self) -> AnimFile:
+        result = AnimFile(self.version, self.num_element_refs, self.num_frames)
+        result.hashed_strings = dict(self.hashed_strings)
+        self._reader.offset = self.entries[0].offset if self.entries else 0
+        for _ in self.entries:
+            result.anims.append(GriftAnimIO.parse_anim_data(self._reader, result))
+        return result
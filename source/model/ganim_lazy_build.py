@@ -0,0 +1,149 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from PIL import Image
+from typing import BinaryIO, Iterator, Optional
+import os, weakref
+
+from source.model.ganim_format import BuildMaterial
+from source.model.image_format import read_image, read_image_size, get_image_nbytes
+from source.model.texture_cache import read_cached_image
+from source.model.anim_source import AnimSource
+
+# Keeps track of the images loaded by lazy materials and unloads the least recently used ones
+# once the budget is exceeded. Unloaded images are read from disk again on next access
+class MaterialImagePool:
+    def __init__(self, max_bytes: Optional[int] = None, max_images: Optional[int] = None) -> None:
+        self.max_bytes = max_bytes
+        self.max_images = max_images
+        self.total_bytes = 0
+        # id(material) -> (weak reference to material, size of its image)
+        self._loaded: OrderedDict[int, tuple[weakref.ref['LazyBuildMaterial'], int]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._loaded)
+
+    def add(self, material: 'LazyBuildMaterial', nbytes: int) -> None:
+        key = id(material)
+        self.discard(material)
+        self._loaded[key] = (weakref.ref(material, lambda _: self.__forget(key)), nbytes)
+        self.total_bytes += nbytes
+        self.evict(keep=material)
+
+    def touch(self, material: 'LazyBuildMaterial') -> None:
+        key = id(material)
+        if key in self._loaded:
+            self._loaded.move_to_end(key)
+
+    def discard(self, material: 'LazyBuildMaterial') -> None:
+        self.__forget(id(material))
+
+    def __forget(self, key: int) -> None:
+        entry = self._loaded.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[1]
+
+    def __over_budget(self) -> bool:
+        if self.max_bytes is not None and self.total_bytes > self.max_bytes:
+            return True
+        return self.max_images is not None and len(self._loaded) > self.max_images
+
+    # Unload images until within budget. The material that was just loaded is never unloaded
+    def evict(self, keep: Optional['LazyBuildMaterial'] = None) -> None:
+        while self.__over_budget() and self._loaded:
+            key, (ref, _) = next(iter(self._loaded.items()))
+            material = ref()
+            if material is keep:
+                if len(self._loaded) == 1:
+                    return
+                self._loaded.move_to_end(key)
+                continue
+            self.__forget(key)
+            if material is not None:
+                material.unload()
+
+    def clear(self) -> None:
+        while self._loaded:
+            key, (ref, _) = self._loaded.popitem(last=False)
+            material = ref()
+            if material is not None:
+                material.unload()
+        self.total_bytes = 0
+
+DEFAULT_MATERIAL_POOL = MaterialImagePool(max_bytes=1 << 30)
+
+# Material whose image is only read from image_path when it is first accessed
+# If source is given, image_path is the name of the file within that source instead of a path on disk
+# Assigning to image replaces the lazy image, and an assigned image is never unloaded.
+# A lazily loaded image is shared with the texture cache, so it must not be edited in place. Assign an edited copy instead
+class LazyBuildMaterial(BuildMaterial):
+    def __init__(self, path: str, image_path: str, pool: Optional[MaterialImagePool] = DEFAULT_MATERIAL_POOL, source: Optional[AnimSource] = None) -> None:
+        self.path = path
+        self.image_path = image_path
+        self.pool = pool
+        self.source = source
+        self._image: Optional[Image.Image] = None
+        self._assigned = False
+        self._size: Optional[tuple[int, int]] = None
+
+    @property
+    def image(self) -> Optional[Image.Image]:
+        if self._image is None and not self._assigned:
+            if self.source is None:
+                image = read_cached_image(self.image_path, copy=False)
+            else:
+                with self.open_file() as file:
+                    image = read_image(file, os.path.splitext(self.image_path)[1])
+                    image.load()
+            self._image = image
+            self._size = image.size
+            if self.pool is not None:
+                self.pool.add(self, get_image_nbytes(self._image))
+        elif self.pool is not None and not self._assigned:
+            self.pool.touch(self)
+        return self._image
+
+    @image.setter
+    def image(self, value: Optional[Image.Image]) -> None:
+        if self.pool is not None:
+            self.pool.discard(self)
+        self._image = value
+        self._assigned = True
+        self._size = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._image is not None
+
+    @property
+    def assigned(self) -> bool:
+        return self._assigned
+
+    # Size of the image, read from the file header if the image is not loaded
+    @property
+    def size(self) -> tuple[int, int]:
+        if self._image is not None:
+            return self._image.size
+        if self._size is None:
+            with self.open_file() as file:
+                self._size = read_image_size(file, os.path.splitext(self.image_path)[1])
+        return self._size
+
+    # Open the file that the image is read from
+    @contextmanager
+    def open_file(self) -> Iterator[BinaryIO]:
+        if self.source is not None:
+            with self.source.open(self.image_path) as file:
+                yield file
+        else:
+            with open(self.image_path, "rb") as file:
+                yield file
+
+    def unload(self) -> None:
+        if self._assigned:
+            return
+        if self.pool is not None:
+            self.pool.discard(self)
+        self._image = None
+
+    def __repr__(self) -> str:
+        return f"LazyBuildMaterial(path={self.path!r}, loaded={self.loaded})"
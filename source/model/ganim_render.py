@@ -0,0 +1,167 @@
+from PIL import Image
+from typing import Optional
+import numpy as np
+
+from source.model.ganim_format import *
+from source.model.ganim_columnar import ELEMENT_DTYPE
+from source.model.crop_cache import CropCache, CropBox, UVRect, get_uv_rect
+
+# Software renderer for anim frames, compositing each element's build frame onto a canvas
+# The math for every element of a frame (matrices, bounds, colour terms) is done at once in NumPy.
+# The warp of each element's image is done by Pillow's affine transform, and the compositing by NumPy on the covered pixels only
+
+# (left, top, right, bottom) in anim space
+Bounds = tuple[float, float, float, float]
+
+# Elements of a frame as an ELEMENT_DTYPE array, the layout used by ColumnarAnimData
+def get_element_array(elements: list[AnimElement]) -> np.ndarray:
+    return np.array([(e.symbol_hash.hash_val, e.frame, e.folder_hash.hash_val,
+        e.c_ap, e.c_bp, e.c_gp, e.c_rp, e.c_aa, e.c_ba, e.c_ga, e.c_ra,
+        e.mat_a, e.mat_b, e.mat_c, e.mat_d, e.tx, e.ty, e.tz) for e in elements], ELEMENT_DTYPE)
+
+class FrameRenderer:
+    # Renderers of the same build can share a crop cache
+    # resample is one of Pillow's filters (Image.NEAREST, Image.BILINEAR or Image.BICUBIC)
+    def __init__(self, build: BuildFile, resample: int = Image.BILINEAR, crop_cache: Optional[CropCache] = None) -> None:
+        self.build = build
+        self.resample = resample
+        self.crops = crop_cache or CropCache(build)
+
+    # Build frames, crop boxes and the matrices from crop pixels to anim space for the elements that can be drawn
+    # Returns the indices of those elements too
+    def prepare(self, elements: np.ndarray) -> tuple[np.ndarray, list[tuple[UVRect, CropBox]], np.ndarray]:
+        indices: list[int] = []
+        crops: list[tuple[UVRect, CropBox]] = []
+        # center x, center y, width, height of the frame; width and height of the crop
+        placement: list[tuple[float, float, float, float, int, int]] = []
+        for i, (symbol_hash, frame_num) in enumerate(zip(elements["symbol_hash"].tolist(), elements["frame"].tolist())):
+            frame = self.build.get_symbol_frame(symbol_hash, frame_num)
+            if frame is None:
+                continue
+            rect = get_uv_rect(frame)
+            box = self.crops.get_box(rect)
+            if box is None:
+                continue
+            indices.append(i)
+            crops.append((rect, box))
+            placement.append((frame.bbox.pos.x, frame.bbox.pos.y, frame.bbox.size.x, frame.bbox.size.y, box[2] - box[0], box[3] - box[1]))
+        selected = elements[indices]
+        x, y, width, height, crop_width, crop_height = np.array(placement, np.float64).reshape(-1, 6).T
+        # The crop is stretched over the frame's bbox, which is centered on (x, y)
+        local = np.zeros((len(indices), 3, 3))
+        local[:, 0, 0] = width / crop_width
+        local[:, 1, 1] = height / crop_height
+        local[:, 0, 2] = x - width / 2
+        local[:, 1, 2] = y - height / 2
+        local[:, 2, 2] = 1
+        # Flash's matrix: x' = a * x + c * y + tx, y' = b * x + d * y + ty
+        element = np.zeros((len(indices), 3, 3))
+        element[:, 0, 0] = selected["mat_a"]
+        element[:, 0, 1] = selected["mat_c"]
+        element[:, 1, 0] = selected["mat_b"]
+        element[:, 1, 1] = selected["mat_d"]
+        element[:, 0, 2] = selected["tx"]
+        element[:, 1, 2] = selected["ty"]
+        element[:, 2, 2] = 1
+        return np.array(indices, np.int64), crops, element @ local
+
+    # Area covered by the elements, in anim space
+    def get_bounds(self, elements: np.ndarray) -> Optional[Bounds]:
+        _, crops, matrices = self.prepare(elements)
+        if not crops:
+            return None
+        corners = get_corners(np.array([(box[2] - box[0], box[3] - box[1]) for _, box in crops], np.float64))
+        points = matrices[:, None, :2, :2] @ corners[..., None] + matrices[:, None, :2, 2:]
+        x0, y0 = points[..., 0, 0].min(), points[..., 1, 0].min()
+        x1, y1 = points[..., 0, 0].max(), points[..., 1, 0].max()
+        return (float(x0), float(y0), float(x1), float(y1))
+
+    # Render a frame (or an ELEMENT_DTYPE array of elements) to an RGBA image
+    # bounds is the area of anim space to show, by default the frame's bbox (or the area covered by the elements)
+    # It is drawn at scale pixels per unit, or scaled to fit max_size x max_size if given
+    def render(self, frame: AnimFrame | np.ndarray, bounds: Optional[Bounds] = None, scale: float = 1.0, max_size: Optional[int] = None,
+            background: tuple[int, int, int, int] = (0, 0, 0, 0)) -> Image.Image:
+        if isinstance(frame, AnimFrame):
+            elements = get_element_array(frame.elements)
+            if bounds is None and frame.size.x > 0 and frame.size.y > 0:
+                bounds = (frame.pos.x - frame.size.x / 2, frame.pos.y - frame.size.y / 2, frame.pos.x + frame.size.x / 2, frame.pos.y + frame.size.y / 2)
+        else:
+            elements = frame
+        if bounds is None:
+            bounds = self.get_bounds(elements) or (0.0, 0.0, 1.0, 1.0)
+        left, top, right, bottom = bounds
+        if max_size is not None:
+            scale = max_size / max(right - left, bottom - top, 1e-6)
+        canvas_size = (max(1, int(np.ceil((right - left) * scale))), max(1, int(np.ceil((bottom - top) * scale))))
+        # Premultiplied RGBA in [0, 1]
+        canvas = np.zeros((canvas_size[1], canvas_size[0], 4), np.float32)
+        background_color = np.array(background, np.float32) / 255
+        canvas[:] = background_color * background_color[3]
+        canvas[..., 3] = background_color[3]
+
+        indices, crops, matrices = self.prepare(elements)
+        if len(indices):
+            view = np.array([[scale, 0, -left * scale], [0, scale, -top * scale], [0, 0, 1]])
+            self.composite(canvas, elements[indices], crops, view @ matrices)
+
+        alpha = canvas[..., 3:]
+        rgb = np.divide(canvas[..., :3], alpha, out=np.zeros_like(canvas[..., :3]), where=alpha > 0)
+        pixels = np.concatenate([rgb, alpha], axis=2)
+        return Image.fromarray(np.clip(pixels * 255 + 0.5, 0, 255).astype(np.uint8), "RGBA")
+
+    # Draw the elements back to front. matrices map crop pixels to canvas pixels
+    def composite(self, canvas: np.ndarray, elements: np.ndarray, crops: list[tuple[UVRect, CropBox]], matrices: np.ndarray) -> None:
+        height, width = canvas.shape[:2]
+        # Colour terms are stored as alpha, blue, green, red
+        multiply = np.stack([elements["c_rp"], elements["c_gp"], elements["c_bp"], elements["c_ap"]], axis=1).astype(np.float32)
+        add = np.stack([elements["c_ra"], elements["c_ga"], elements["c_ba"], elements["c_aa"]], axis=1).astype(np.float32)
+
+        sizes = np.array([(box[2] - box[0], box[3] - box[1]) for _, box in crops], np.float64)
+        corners = matrices[:, None, :2, :2] @ get_corners(sizes)[..., None] + matrices[:, None, :2, 2:]
+        x0 = np.clip(np.floor(corners[:, :, 0, 0].min(axis=1)), 0, width).astype(np.int64)
+        y0 = np.clip(np.floor(corners[:, :, 1, 0].min(axis=1)), 0, height).astype(np.int64)
+        x1 = np.clip(np.ceil(corners[:, :, 0, 0].max(axis=1)), 0, width).astype(np.int64)
+        y1 = np.clip(np.ceil(corners[:, :, 1, 0].max(axis=1)), 0, height).astype(np.int64)
+        # Elements that can't be seen: off the canvas, or squashed flat
+        visible = (x1 > x0) & (y1 > y0) & (np.abs(np.linalg.det(matrices[:, :2, :2])) > 1e-9)
+        inverse = np.zeros_like(matrices)
+        inverse[visible] = np.linalg.inv(matrices[visible])
+        # Pillow's affine data maps pixels of the output (which starts at x0, y0) to pixels of the input
+        offset = np.zeros_like(matrices)
+        offset[:, 0, 0] = offset[:, 1, 1] = offset[:, 2, 2] = 1
+        offset[:, 0, 2] = x0
+        offset[:, 1, 2] = y0
+        affine = (inverse @ offset)[:, :2, :].reshape(-1, 6)
+
+        # Higher tz is further back. The sort is stable, so ties keep the order of the file
+        for i in np.argsort(-elements["tz"], kind="stable").tolist():
+            if not visible[i]:
+                continue
+            # Premultiplied, so the filtering of the warp doesn't bleed the colour of transparent pixels
+            crop = self.crops.get(crops[i][0], premultiplied=True)
+            if crop is None:
+                continue
+            size = (int(x1[i] - x0[i]), int(y1[i] - y0[i]))
+            warped = crop.transform(size, Image.AFFINE, tuple(affine[i].tolist()), self.resample)
+            source = np.asarray(warped, np.float32) / 255
+            alpha = source[..., 3:]
+            # Colour terms apply to straight (not premultiplied) colour, like Flash's ColorTransform
+            color = np.divide(source, alpha, out=np.zeros_like(source), where=alpha > 0)
+            color[..., 3:] = alpha
+            color = np.clip(color * multiply[i] + add[i], 0, 1)
+            # Pixels outside the image stay transparent, even with an additive alpha term
+            color[..., 3:] *= alpha > 0
+            target = canvas[y0[i]:y1[i], x0[i]:x1[i]]
+            target *= 1 - color[..., 3:]
+            target[..., :3] += color[..., :3] * color[..., 3:]
+            target[..., 3:] += color[..., 3:]
+
+# Corners of images of the given sizes, in pixels: shape (count, 4, 2)
+def get_corners(sizes: np.ndarray) -> np.ndarray:
+    corners = np.zeros((len(sizes), 4, 2))
+    corners[:, 1, 0] = corners[:, 3, 0] = sizes[:, 0]
+    corners[:, 2, 1] = corners[:, 3, 1] = sizes[:, 1]
+    return corners
+
+def render_frame(build: BuildFile, frame: AnimFrame, scale: float = 1.0, max_size: Optional[int] = None) -> Image.Image:
+    return FrameRenderer(build).render(frame, scale=scale, max_size=max_size)
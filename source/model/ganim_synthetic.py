@@ -0,0 +1,80 @@
+from dataclasses import dataclass
+import random
+
+from source.model.ganim_format import *
+
+# Sizes of the synthetic data generated for benchmarks and round-trip checks
+@dataclass
+class SyntheticScale:
+    num_symbols: int = 200
+    frames_per_symbol: int = 8
+    num_materials: int = 2
+    num_anims: int = 50
+    frames_per_anim: int = 30
+    elements_per_frame: int = 40
+    # Extra hashed strings on top of the symbol and folder names
+    num_hashed_strings: int = 1000
+    hashed_string_length: int = 48
+
+def make_hash(rng: random.Random, used: set[int]) -> int:
+    while True:
+        hash_val = rng.getrandbits(32)
+        if hash_val not in used:
+            used.add(hash_val)
+            return hash_val
+
+def make_name(rng: random.Random, prefix: str, length: int) -> str:
+    alphabet = "abcdefghijklmnopqrstuvwxyz_0123456789"
+    return prefix + "".join(rng.choice(alphabet) for _ in range(max(0, length - len(prefix))))
+
+# Floats are rounded to values that are exact in 32 bits, so data survives a round trip unchanged
+def make_float(rng: random.Random, low: float, high: float) -> float:
+    return round(rng.uniform(low, high) * 64) / 64
+
+def make_build_file(scale: SyntheticScale, seed: int = 0) -> BuildFile:
+    rng = random.Random(seed)
+    used: set[int] = set()
+    result = BuildFile(build_name="synthetic_build", total_frames=scale.num_symbols * scale.frames_per_symbol)
+    for i in range(scale.num_materials):
+        result.materials.append(BuildMaterial(f"atlas{i}.tex"))
+    for i in range(scale.num_symbols):
+        symbol = BuildSymbol(HashRef(make_hash(rng, used), result), HashRef(make_hash(rng, used), result), rng.random() < 0.5)
+        result.hashed_strings[symbol.symbol_hash.hash_val] = make_name(rng, f"symbol{i}_", scale.hashed_string_length)
+        result.hashed_strings[symbol.color_channel_hash.hash_val] = make_name(rng, f"channel{i}_", scale.hashed_string_length)
+        for j in range(scale.frames_per_symbol):
+            u0 = Coord(make_float(rng, 0, 0.5), make_float(rng, 0, 0.5))
+            u1 = Coord(u0.x + make_float(rng, 0, 0.5), u0.y + make_float(rng, 0, 0.5))
+            bbox = BBox(Coord(make_float(rng, -100, 100), make_float(rng, -100, 100)), Coord(make_float(rng, 1, 200), make_float(rng, 1, 200)))
+            image_index = rng.randrange(scale.num_materials) if scale.num_materials else 0
+            symbol.frames.append(BuildFrame(j, 1, image_index, bbox, u0, u1))
+        result.symbols.append(symbol)
+    for i in range(scale.num_hashed_strings):
+        result.hashed_strings[make_hash(rng, used)] = make_name(rng, f"string{i}_", scale.hashed_string_length)
+    return result
+
+def make_anim_file(scale: SyntheticScale, seed: int = 0) -> AnimFile:
+    rng = random.Random(seed)
+    used: set[int] = set()
+    result = AnimFile(num_element_refs=scale.elements_per_frame, num_frames=scale.num_anims * scale.frames_per_anim)
+    symbol_hashes = [make_hash(rng, used) for _ in range(max(1, scale.num_symbols))]
+    folder_hash = make_hash(rng, used)
+    for i, hash_val in enumerate(symbol_hashes):
+        result.hashed_strings[hash_val] = make_name(rng, f"symbol{i}_", scale.hashed_string_length)
+    result.hashed_strings[folder_hash] = "synthetic_folder"
+    for i in range(scale.num_anims):
+        anim = AnimData(make_name(rng, f"anim{i}_", 16), "root", 30.0, rng.random() < 0.5)
+        for _ in range(scale.frames_per_anim):
+            frame = AnimFrame(Coord(make_float(rng, -200, 0), make_float(rng, -200, 0)), Coord(make_float(rng, 0, 400), make_float(rng, 0, 400)))
+            for z in range(scale.elements_per_frame):
+                frame.elements.append(AnimElement(
+                    HashRef(rng.choice(symbol_hashes), result), rng.randrange(scale.frames_per_symbol or 1), HashRef(folder_hash, result),
+                    1.0, 1.0, 1.0, 1.0,
+                    0.0, 0.0, 0.0, 0.0,
+                    make_float(rng, -1, 1), make_float(rng, -1, 1), make_float(rng, -1, 1), make_float(rng, -1, 1),
+                    make_float(rng, -300, 300), make_float(rng, -300, 300),
+                    float(z)))
+            anim.frames.append(frame)
+        result.anims.append(anim)
+    for i in range(scale.num_hashed_strings):
+        result.hashed_strings[make_hash(rng, used)] = make_name(rng, f"string{i}_", scale.hashed_string_length)
+    return result
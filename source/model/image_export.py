@@ -0,0 +1,94 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+from dataclasses import dataclass
+from PIL import Image
+from typing import BinaryIO, Callable, ContextManager, Optional
+import os, shutil
+
+from source.model.image_format import write_image
+from source.model.file_util import make_temp_file
+
+@dataclass
+class ExportItem:
+    path: str
+    # Writes the contents of the file to the temporary file
+    write: Callable[[BinaryIO], None]
+    temp_path: Optional[str] = None
+
+# Encodes images on a pool of threads, then moves them into place once all of them succeeded
+# Encoding happens in Pillow's encoders and NumPy, which release the GIL, so threads run in parallel without copying images to other processes
+# Every image is encoded to a temporary file next to its destination, so a failed export leaves existing files untouched
+# Use as a context manager, so temporary files are removed if the export is abandoned
+class ImageExporter:
+    def __init__(self, max_workers: Optional[int] = None) -> None:
+        self.max_workers = max_workers
+        self.items: list[ExportItem] = []
+        self.encoded = False
+
+    def __enter__(self) -> 'ImageExporter':
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.discard()
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def add_image(self, path: str, image: Image.Image, pixel_format: Optional[str] = None, mipmaps: bool = False) -> None:
+        extension = os.path.splitext(path)[1]
+        self.add(path, lambda file: write_image(file, image, extension, pixel_format, mipmaps))
+
+    # Copy a file that is already encoded (e.g. the file a material was read from)
+    def add_copy(self, path: str, open_source: Callable[[], ContextManager[BinaryIO]]) -> None:
+        def copy(file: BinaryIO) -> None:
+            with open_source() as source_file:
+                shutil.copyfileobj(source_file, file)
+        self.add(path, copy)
+
+    def add(self, path: str, write: Callable[[BinaryIO], None]) -> None:
+        if self.encoded:
+            raise ValueError("Images can't be added after encoding")
+        self.items.append(ExportItem(path, write))
+
+    def encode_item(self, item: ExportItem) -> None:
+        fd, item.temp_path = make_temp_file(item.path)
+        with os.fdopen(fd, "wb") as file:
+            item.write(file)
+
+    # Encode every image. If any of them fails, the rest are cancelled, the temporary files removed, and the first error raised
+    def encode(self) -> None:
+        if self.encoded:
+            return
+        try:
+            if len(self.items) <= 1 or self.max_workers == 1:
+                for item in self.items:
+                    self.encode_item(item)
+            else:
+                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                    futures = [executor.submit(self.encode_item, item) for item in self.items]
+                    done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+                    for future in pending:
+                        future.cancel()
+                    for future in futures:
+                        if future in done and future.exception() is not None:
+                            raise future.exception()
+        except BaseException:
+            self.discard()
+            raise
+        self.encoded = True
+
+    # Move the encoded images to their destinations
+    def write(self) -> None:
+        self.encode()
+        for item in self.items:
+            if item.temp_path is not None:
+                os.replace(item.temp_path, item.path)
+                item.temp_path = None
+
+    def discard(self) -> None:
+        for item in self.items:
+            if item.temp_path is not None:
+                try:
+                    os.remove(item.temp_path)
+                except OSError:
+                    pass
+                item.temp_path = None
@@ -1,71 +1,369 @@
 from PIL import Image
 import io, os
-from struct import pack, unpack
-from typing import Optional
+import numpy as np
+from contextlib import contextmanager
+from dataclasses import dataclass
+from struct import pack, unpack, Struct
+from typing import BinaryIO, Iterator, Optional
+
+from source.model import dxt_codec
 
 KTEX_VERSION = 2
+KTEX_MAGIC = b"KTEX"
+# Magic word, version, width and height, followed by the DDS data (which holds the mip levels)
+KTEX_HEADER_STRUCT = Struct("<4sBHH")
+
+# Images can be read from a path or from an open binary file (e.g. a member of a zip archive)
+# Images read from an open file must be loaded before the file is closed
+ImageFile = str | BinaryIO
+
+@contextmanager
+def open_image_file(file: ImageFile) -> Iterator[BinaryIO]:
+    if isinstance(file, str):
+        with open(file, "rb") as infile:
+            yield infile
+    else:
+        yield file
+
+# Images can be written to a path or to an open binary file. Writing to a file needs the extension to be known
+@contextmanager
+def open_output_file(file: ImageFile) -> Iterator[BinaryIO]:
+    if isinstance(file, str):
+        with open(file, "wb") as outfile:
+            yield outfile
+    else:
+        yield file
+
+def get_image_extension(file: ImageFile, extension: Optional[str] = None) -> str:
+    if extension is None:
+        _, extension = os.path.splitext(file if isinstance(file, str) else getattr(file, "name", ""))
+    return extension.lower()
 
-def read_ktex(filename: str) -> Image.Image:
-    with open(filename, "rb") as infile:
+# Read the DDS data of a KTEX file. Plain DDS files with a .tex extension are accepted too
+def read_ktex_data(filename: ImageFile) -> bytes:
+    with open_image_file(filename) as infile:
+        start=infile.tell()
         magic=infile.read(4)
         disc=infile.read(5)
 
-        if magic==b"KTEX":
+        if magic==KTEX_MAGIC:
             data=infile.read()
         elif b"DDS" in magic:
-            infile.seek(0)
+            infile.seek(start)
             data=infile.read()
         else:
             raise ValueError("Unknown format")
+    return data
+
+def read_ktex(filename: ImageFile) -> Image.Image:
+    return open_dds_data(read_ktex_data(filename))
+
+# Every mip level of a KTEX file, largest first
+def read_ktex_mips(filename: ImageFile) -> list[Image.Image]:
+    return [Image.fromarray(level, "RGBA") for level in decode_dds_mips(read_ktex_data(filename))]
 
-    image=Image.open(io.BytesIO(data))
-    return image
+# Open DDS data with Pillow, falling back to the NumPy block decoder for DXT1/DXT5 data Pillow can't read
+# Uncompressed 32-bit data is decoded with NumPy too, since newer Pillow versions decode it one pixel at a time
+def open_dds_data(data: bytes) -> Image.Image:
+    if is_rgb32_dds(data):
+        pixels = decode_dds(data)
+        if probe_dds_data(data).pixel_format == "RGB8":
+            return Image.fromarray(np.ascontiguousarray(pixels[:, :, :3]), "RGB")
+        return Image.fromarray(pixels, "RGBA")
+    try:
+        image=Image.open(io.BytesIO(data))
+        image.load()
+        return image
+    except (OSError, NotImplementedError):
+        if get_dds_block_format(data) is None:
+            raise
+    return Image.fromarray(decode_dds(data), "RGBA")
 
-def write_ktex(filename: str, image: Image.Image) -> None:
-    with open(filename, "wb") as outfile:
-        # Write magic word
-        outfile.write(b"KTEX")
-        # Write version
-        outfile.write(pack("<B", KTEX_VERSION))
+# pixel_format is "DXT1" or "DXT5" to block-compress the image, or None for uncompressed data
+# mipmaps adds the full mip chain, down to 1x1
+def write_ktex(filename: ImageFile, image: Image.Image, pixel_format: Optional[str] = None, mipmaps: bool = False) -> None:
+    with open_output_file(filename) as outfile:
         width, height = image.size
-        outfile.write(pack("<H", width))
-        outfile.write(pack("<H", height))
+        outfile.write(KTEX_HEADER_STRUCT.pack(KTEX_MAGIC, KTEX_VERSION, width, height))
         # Write actual file content
-        image.save(outfile, "DDS")
+        if pixel_format or mipmaps:
+            outfile.write(encode_dds(image, pixel_format, mipmaps))
+        else:
+            image.save(outfile, "DDS")
 
-def read_dds(filename: str) -> Image.Image:
-    return Image.open(filename, formats=["DDS"])
+def read_dds(filename: ImageFile) -> Image.Image:
+    with open_image_file(filename) as infile:
+        return open_dds_data(infile.read())
 
-def write_dds(filename: str, image: Image.Image) -> None:
-    image.save(filename, "DDS")
+def write_dds(filename: ImageFile, image: Image.Image, pixel_format: Optional[str] = None, mipmaps: bool = False) -> None:
+    if pixel_format or mipmaps:
+        with open_output_file(filename) as outfile:
+            outfile.write(encode_dds(image, pixel_format, mipmaps))
+    else:
+        image.save(filename, "DDS")
 
-def read_png(filename: str) -> Image.Image:
+def read_png(filename: ImageFile) -> Image.Image:
     return Image.open(filename, formats=["PNG"])
 
-def write_png(filename: str, image: Image.Image) -> None:
+def write_png(filename: ImageFile, image: Image.Image) -> None:
     image.save(filename, "PNG")
 
-def read_image(filename: str, extension: Optional[str] = None) -> Image.Image:
-    if extension is None:
-        _, extension = os.path.splitext(filename)
-    if extension.lower() == ".tex":
+@dataclass
+class ImageInfo:
+    # "KTEX", "DDS" or "PNG"
+    container: str = ""
+    width: int = 0
+    height: int = 0
+    # e.g. "DXT5", "RGBA8", "RGB8", "L8" (DDS) or "RGBA8", "P8" (PNG)
+    pixel_format: str = ""
+    mip_count: int = 1
+    # Block compression of the data ("BC1", "BC3", ...), "deflate" for PNG, or "" if uncompressed
+    compression: str = ""
+
+DDS_MAGIC = b"DDS "
+# dwSize, dwFlags, dwHeight, dwWidth, dwPitchOrLinearSize, dwDepth, dwMipMapCount, dwReserved1[11],
+# then the pixel format: dwSize, dwFlags, dwFourCC, dwRGBBitCount, dwRBitMask, dwGBitMask, dwBBitMask, dwABitMask
+DDS_HEADER_STRUCT = Struct("<7I44x2I4s5I")
+DDS_HEADER_SIZE = 124
+DDSD_MIPMAPCOUNT = 0x20000
+DDPF_ALPHAPIXELS = 0x1
+DDPF_FOURCC = 0x4
+DDPF_RGB = 0x40
+DDPF_LUMINANCE = 0x20000
+DDS_FOURCC_COMPRESSION = {
+    b"DXT1": "BC1",
+    b"DXT2": "BC2",
+    b"DXT3": "BC2",
+    b"DXT4": "BC3",
+    b"DXT5": "BC3",
+    b"ATI1": "BC4",
+    b"BC4U": "BC4",
+    b"ATI2": "BC5",
+    b"BC5U": "BC5",
+}
+# DXGI formats of the DX10 extension header that Pillow can read
+DXGI_FORMATS = {
+    28: ("RGBA8", ""),
+    29: ("RGBA8", ""),
+    71: ("BC1", "BC1"),
+    72: ("BC1", "BC1"),
+    74: ("BC2", "BC2"),
+    75: ("BC2", "BC2"),
+    77: ("BC3", "BC3"),
+    78: ("BC3", "BC3"),
+    80: ("BC4", "BC4"),
+    83: ("BC5", "BC5"),
+    95: ("BC6H", "BC6H"),
+    98: ("BC7", "BC7"),
+    99: ("BC7", "BC7"),
+}
+
+PNG_MAGIC = b"\x89PNG\r\n\x1a\n"
+# Length and type of the IHDR chunk, width, height, bit depth, color type
+PNG_IHDR_STRUCT = Struct(">I4sIIBB")
+PNG_COLOR_TYPES = {0: "L", 2: "RGB", 3: "P", 4: "LA", 6: "RGBA"}
+
+def read_exact(infile: BinaryIO, size: int) -> bytes:
+    data = infile.read(size)
+    if len(data) != size:
+        raise ValueError("Unexpected end of file in image header")
+    return data
+
+# Parse a DDS header, starting after the "DDS " magic
+def probe_dds_header(infile: BinaryIO, container: str = "DDS") -> ImageInfo:
+    header = read_exact(infile, DDS_HEADER_SIZE)
+    size, flags, height, width, _, _, mip_count, _, pf_flags, fourcc, bit_count, _, _, _, a_mask = DDS_HEADER_STRUCT.unpack_from(header)
+    if size != DDS_HEADER_SIZE:
+        raise ValueError("Invalid DDS header")
+    result = ImageInfo(container, width, height, mip_count=max(1, mip_count) if flags & DDSD_MIPMAPCOUNT else 1)
+    if pf_flags & DDPF_FOURCC:
+        if fourcc == b"DX10":
+            dxgi_format = unpack("<I", read_exact(infile, 20)[:4])[0]
+            result.pixel_format, result.compression = DXGI_FORMATS.get(dxgi_format, (f"DXGI{dxgi_format}", ""))
+        else:
+            result.pixel_format = fourcc.decode("ascii", "replace")
+            result.compression = DDS_FOURCC_COMPRESSION.get(fourcc, "")
+    elif pf_flags & DDPF_RGB:
+        result.pixel_format = ("RGBA" if pf_flags & DDPF_ALPHAPIXELS and a_mask else "RGB") + ("8" if bit_count in (24, 32) else str(bit_count))
+    elif pf_flags & DDPF_LUMINANCE:
+        result.pixel_format = "LA8" if pf_flags & DDPF_ALPHAPIXELS else "L8"
+    return result
+
+def probe_png_header(infile: BinaryIO) -> ImageInfo:
+    _, chunk_type, width, height, bit_depth, color_type = PNG_IHDR_STRUCT.unpack(read_exact(infile, PNG_IHDR_STRUCT.size))
+    if chunk_type != b"IHDR":
+        raise ValueError("Invalid PNG header")
+    return ImageInfo("PNG", width, height, PNG_COLOR_TYPES.get(color_type, "?") + str(bit_depth), 1, "deflate")
+
+# Get the size and format of an image by reading only its header
+# The format is detected from the data, so .tex files holding plain DDS data are handled too
+def probe_image(filename: ImageFile) -> ImageInfo:
+    with open_image_file(filename) as infile:
+        magic = read_exact(infile, 4)
+        if magic == KTEX_MAGIC:
+            _, _, width, height = KTEX_HEADER_STRUCT.unpack(magic + read_exact(infile, KTEX_HEADER_STRUCT.size - 4))
+            if read_exact(infile, 4) != DDS_MAGIC:
+                raise ValueError("Unknown format")
+            result = probe_dds_header(infile, "KTEX")
+            result.width, result.height = width, height
+            return result
+        if magic == DDS_MAGIC:
+            return probe_dds_header(infile)
+        if magic + read_exact(infile, 4) == PNG_MAGIC:
+            return probe_png_header(infile)
+    raise ValueError("Unknown format")
+
+# Get the size of an image without decoding it
+def read_image_size(filename: ImageFile, extension: Optional[str] = None) -> tuple[int, int]:
+    if get_image_extension(filename, extension) not in (".tex", ".dds", ".png"):
+        raise ValueError("Unknown format")
+    info = probe_image(filename)
+    return info.width, info.height
+
+# Approximate memory used by a decoded image
+def get_image_nbytes(image: Image.Image) -> int:
+    width, height = image.size
+    return width * height * len(image.getbands())
+
+def read_image(filename: ImageFile, extension: Optional[str] = None) -> Image.Image:
+    extension = get_image_extension(filename, extension)
+    if extension == ".tex":
         return read_ktex(filename)
-    elif extension.lower() == ".dds":
+    elif extension == ".dds":
         return read_dds(filename)
-    elif extension.lower() == ".png":
+    elif extension == ".png":
         return read_png(filename)
     raise ValueError("Unknown format")
 
-def write_image(filename: str, image: Image.Image, extension: Optional[str] = None) -> None:
-    if extension is None:
-        _, extension = os.path.splitext(filename)
+def write_image(filename: ImageFile, image: Image.Image, extension: Optional[str] = None, pixel_format: Optional[str] = None, mipmaps: bool = False) -> None:
+    extension = get_image_extension(filename, extension)
     if extension.lower() == ".tex":
-        write_ktex(filename, image)
+        write_ktex(filename, image, pixel_format, mipmaps)
         return
     elif extension.lower() == ".dds":
-        write_dds(filename, image)
+        write_dds(filename, image, pixel_format, mipmaps)
         return
     elif extension.lower() == ".png":
         write_png(filename, image)
         return
     raise ValueError("Unknown format")
+
+### Mip chains
+
+def get_mip_count(width: int, height: int) -> int:
+    return max(width, height, 1).bit_length()
+
+# Halve a (height, width, 4) array with a 2x2 box filter, rounding sizes down like DDS mip levels
+# The last row or column of odd sizes is dropped, and sizes of 1 stay 1
+def downsample(image: np.ndarray) -> np.ndarray:
+    height, width = image.shape[:2]
+    image = image[:max(2, height - height % 2), :max(2, width - width % 2)]
+    image = np.pad(image, ((0, 2 - min(height, 2)), (0, 2 - min(width, 2)), (0, 0)), mode="edge").astype(np.uint16)
+    total = image[0::2, 0::2] + image[1::2, 0::2] + image[0::2, 1::2] + image[1::2, 1::2]
+    return ((total + 2) >> 2).astype(np.uint8)
+
+# The image and its mip levels, largest first, down to 1x1
+def make_mip_chain(image: np.ndarray) -> list[np.ndarray]:
+    levels = [image]
+    for _ in range(get_mip_count(image.shape[1], image.shape[0]) - 1):
+        levels.append(downsample(levels[-1]))
+    return levels
+
+def get_mip_size(size: int, level: int) -> int:
+    return max(1, size >> level)
+
+### DDS data encoded and decoded with NumPy (BC1/BC3 blocks, or uncompressed 32-bit pixels)
+
+DDSD_CAPS = 0x1
+DDSD_HEIGHT = 0x2
+DDSD_WIDTH = 0x4
+DDSD_PITCH = 0x8
+DDSD_PIXELFORMAT = 0x1000
+DDSD_LINEARSIZE = 0x80000
+DDSCAPS_COMPLEX = 0x8
+DDSCAPS_TEXTURE = 0x1000
+DDSCAPS_MIPMAP = 0x400000
+DDS_PIXEL_FORMAT_SIZE = 32
+DDS_DX10_HEADER_SIZE = 20
+# Red, green, blue and alpha masks of uncompressed data, stored as B, G, R, A bytes like Pillow writes it
+RGBA8_MASKS = (0x00ff0000, 0x0000ff00, 0x000000ff, 0xff000000)
+
+def probe_dds_data(data: bytes) -> ImageInfo:
+    if data[:4] != DDS_MAGIC:
+        raise ValueError("Unknown format")
+    # Only the header (and the DX10 header that may follow it) is copied, not the pixels
+    return probe_dds_header(io.BytesIO(data[4:4 + DDS_HEADER_SIZE + DDS_DX10_HEADER_SIZE]))
+
+# The codec format ("DXT1" or "DXT5") of DDS data, or None if the NumPy codec can't decode it
+def get_dds_block_format(data: bytes) -> Optional[str]:
+    return dxt_codec.COMPRESSION_FORMATS.get(probe_dds_data(data).compression)
+
+def decode_rgb_pixels(data: bytes, width: int, height: int, masks: tuple[int, int, int, int]) -> np.ndarray:
+    pixels = np.frombuffer(data, "<u4", width * height).reshape(height, width)
+    result = np.full((height, width, 4), 255, np.uint8)
+    for channel, mask in enumerate(masks):
+        if mask:
+            shift = (mask & -mask).bit_length() - 1
+            result[:, :, channel] = (pixels & mask) >> shift
+    return result
+
+def is_rgb32_dds(data: bytes) -> bool:
+    if len(data) < len(DDS_MAGIC) + DDS_HEADER_SIZE or data[:4] != DDS_MAGIC:
+        return False
+    _, _, _, _, _, _, _, _, pf_flags, _, bit_count, *_ = DDS_HEADER_STRUCT.unpack_from(data, len(DDS_MAGIC))
+    return bool(pf_flags & DDPF_RGB) and bit_count == 32
+
+# Decode the mip levels of DDS data to (height, width, 4) RGBA arrays, largest first
+def decode_dds_mips(data: bytes, max_levels: Optional[int] = None) -> list[np.ndarray]:
+    info = probe_dds_data(data)
+    _, _, _, _, _, _, _, _, pf_flags, _, bit_count, *masks = DDS_HEADER_STRUCT.unpack_from(data, len(DDS_MAGIC))
+    block_format = dxt_codec.COMPRESSION_FORMATS.get(info.compression)
+    if block_format is None and not (pf_flags & DDPF_RGB and bit_count == 32):
+        raise ValueError(f"Unsupported DDS pixel format {info.pixel_format}")
+    if not pf_flags & DDPF_ALPHAPIXELS:
+        masks[3] = 0
+    offset = len(DDS_MAGIC) + DDS_HEADER_SIZE
+    if data[84:88] == b"DX10":
+        offset += DDS_DX10_HEADER_SIZE
+    levels: list[np.ndarray] = []
+    for level in range(min(info.mip_count, max_levels or info.mip_count)):
+        width = get_mip_size(info.width, level)
+        height = get_mip_size(info.height, level)
+        size = dxt_codec.get_data_size(block_format, width, height) if block_format else width * height * 4
+        if len(data) < offset + size:
+            raise ValueError("Unexpected end of file in DDS data")
+        if block_format:
+            levels.append(dxt_codec.DECODERS[block_format](data[offset:offset + size], width, height))
+        else:
+            levels.append(decode_rgb_pixels(data[offset:offset + size], width, height, tuple(masks)))
+        offset += size
+    return levels
+
+# Decode the first mip level of DDS data to a (height, width, 4) RGBA array
+def decode_dds(data: bytes) -> np.ndarray:
+    return decode_dds_mips(data, 1)[0]
+
+def encode_dds(image: Image.Image, pixel_format: Optional[str] = None, mipmaps: bool = False) -> bytes:
+    if pixel_format and pixel_format not in dxt_codec.ENCODERS:
+        raise ValueError(f"Unsupported DDS pixel format {pixel_format}")
+    width, height = image.size
+    pixels = np.asarray(image.convert("RGBA"))
+    levels = make_mip_chain(pixels) if mipmaps else [pixels]
+    flags = DDSD_CAPS | DDSD_HEIGHT | DDSD_WIDTH | DDSD_PIXELFORMAT
+    caps = DDSCAPS_TEXTURE
+    if mipmaps:
+        flags |= DDSD_MIPMAPCOUNT
+        caps |= DDSCAPS_COMPLEX | DDSCAPS_MIPMAP
+    if pixel_format:
+        data = [dxt_codec.ENCODERS[pixel_format](level) for level in levels]
+        flags |= DDSD_LINEARSIZE
+        pitch = len(data[0])
+        pixel_format_fields = (DDPF_FOURCC, pixel_format.encode("ascii"), 0, 0, 0, 0, 0)
+    else:
+        data = [level[:, :, [2, 1, 0, 3]].tobytes() for level in levels]
+        flags |= DDSD_PITCH
+        pitch = width * 4
+        pixel_format_fields = (DDPF_RGB | DDPF_ALPHAPIXELS, b"\0\0\0\0", 32, *RGBA8_MASKS)
+    header = DDS_HEADER_STRUCT.pack(DDS_HEADER_SIZE, flags, height, width, pitch, 0, len(levels) if mipmaps else 0,
+        DDS_PIXEL_FORMAT_SIZE, *pixel_format_fields)
+    return DDS_MAGIC + header + pack("<5I", caps, 0, 0, 0, 0) + b"".join(data)
@@ -0,0 +1,321 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from PIL import Image
+from struct import Struct
+from typing import Optional
+import atexit, hashlib, io, json, os, threading, time
+
+from source.model.image_format import read_image, probe_image, get_image_nbytes
+from source.model.file_util import write_file_atomic
+
+@dataclass
+class CachedTexture:
+    # File modification time (in nanoseconds) and size when the image was decoded
+    mtime: int
+    file_size: int
+    image: Image.Image
+    nbytes: int
+
+# Decoded images shared by every reader of the same file, evicted least recently used first
+# Entries are keyed by absolute path and checked against the file's mtime and size, so a changed file is decoded again
+# Callers get a copy of the cached image by default, so editing it in place doesn't change what others read
+class TextureCache:
+    def __init__(self, max_bytes: Optional[int] = None) -> None:
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, CachedTexture] = OrderedDict()
+        self._lock = threading.Lock()
+        # Where images missing from memory are looked up before decoding them
+        self.disk_cache: Optional['DiskTextureCache'] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, path: str) -> bool:
+        return TextureCache.get_key(path) in self._entries
+
+    @staticmethod
+    def get_key(path: str) -> str:
+        return os.path.normcase(os.path.abspath(path))
+
+    # copy can be turned off by callers that never modify the image
+    def read(self, path: str, extension: Optional[str] = None, copy: bool = True) -> Image.Image:
+        key = TextureCache.get_key(path)
+        stat = os.stat(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.mtime == stat.st_mtime_ns and entry.file_size == stat.st_size:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                image = entry.image
+            else:
+                self.misses += 1
+                image = None
+        if image is None:
+            # Decode outside the lock, so other threads can read other textures meanwhile
+            extension = extension or os.path.splitext(path)[1]
+            if self.disk_cache is not None and self.disk_cache.handles(extension):
+                image = self.disk_cache.read(key, extension)
+            else:
+                image = read_image(key, extension)
+                image.load()
+            self.put(key, CachedTexture(stat.st_mtime_ns, stat.st_size, image, get_image_nbytes(image)))
+        return image.copy() if copy else image
+
+    def put(self, key: str, entry: CachedTexture) -> None:
+        with self._lock:
+            self.__forget(key)
+            # Images larger than the whole budget are not kept
+            if self.max_bytes is not None and entry.nbytes > self.max_bytes:
+                return
+            self._entries[key] = entry
+            self.total_bytes += entry.nbytes
+            self.__evict()
+
+    def invalidate(self, path: str) -> None:
+        with self._lock:
+            self.__forget(TextureCache.get_key(path))
+
+    def __forget(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry.nbytes
+
+    def __evict(self) -> None:
+        while self.max_bytes is not None and self.total_bytes > self.max_bytes and self._entries:
+            _, entry = self._entries.popitem(last=False)
+            self.total_bytes -= entry.nbytes
+
+    def evict(self) -> None:
+        with self._lock:
+            self.__evict()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+DISK_CACHE_MAGIC = b"GTXC"
+DISK_CACHE_VERSION = 2
+# Magic, version, image mode (padded with zeros), width and height, followed by the raw pixels
+DISK_CACHE_HEADER_STRUCT = Struct("<4sI8sII")
+DISK_CACHE_INDEX = "index.json"
+
+def get_default_cache_folder() -> str:
+    base = os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "GriftlandsAnimConversion", "textures")
+
+def hash_file(path: str) -> str:
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as file:
+        while chunk := file.read(1 << 20):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Decoded images and thumbnails kept on disk between runs, keyed by a hash of the file's contents
+# The hash of each path is remembered in an index (with the file's mtime and size), so unchanged files aren't hashed again
+# The index is written by flush(), which runs on cleanup and when the program exits
+# Files unused for the longest are removed first when the cache grows past max_bytes, or after max_age seconds
+class DiskTextureCache:
+    def __init__(self, folder: str, max_bytes: Optional[int] = 2 << 30, max_age: Optional[float] = None, extensions: tuple[str, ...] = (".tex", ".dds", ".png")) -> None:
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.extensions = extensions
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Absolute path -> [mtime, size, hash]
+        self._index: dict[str, list] = {}
+        # Whether the index changed since it was written
+        self._index_dirty = False
+        os.makedirs(folder, exist_ok=True)
+        self.load_index()
+        self.total_bytes = sum(size for _, _, size in self.list_files())
+        self.cleanup()
+        atexit.register(self.flush)
+
+    def handles(self, extension: str) -> bool:
+        return extension.lower() in self.extensions
+
+    def load_index(self) -> None:
+        try:
+            with open(os.path.join(self.folder, DISK_CACHE_INDEX), "r") as index_file:
+                self._index = json.load(index_file)
+        except (OSError, ValueError):
+            self._index = {}
+
+    def save_index(self) -> None:
+        with self._lock:
+            data = json.dumps(self._index).encode()
+            self._index_dirty = False
+        write_file_atomic(os.path.join(self.folder, DISK_CACHE_INDEX), data)
+
+    # Write the index if it changed, so hashes of new files are kept for the next run
+    def flush(self) -> None:
+        if self._index_dirty:
+            self.save_index()
+
+    def get_hash(self, path: str) -> str:
+        path = TextureCache.get_key(path)
+        stat = os.stat(path)
+        with self._lock:
+            entry = self._index.get(path)
+        if entry is not None and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+            return entry[2]
+        digest = hash_file(path)
+        with self._lock:
+            self._index[path] = [stat.st_mtime_ns, stat.st_size, digest]
+            self._index_dirty = True
+        return digest
+
+    def get_entry_path(self, digest: str, suffix: str) -> str:
+        return os.path.join(self.folder, digest[:2], digest + suffix)
+
+    # Decoded image of a file, decoding and storing it if it isn't cached yet
+    # Block-compressed textures decode faster than their pixels can be read back, so only their thumbnails are stored
+    # Raw pixels can't hold a palette or a transparent colour key, so images that have one aren't stored either
+    def read(self, path: str, extension: Optional[str] = None) -> Image.Image:
+        if probe_image(path).compression.startswith("BC"):
+            image = read_image(path, extension or os.path.splitext(path)[1])
+            image.load()
+            return image
+        entry_path = self.get_entry_path(self.get_hash(path), ".rgba")
+        image = self.load_entry(entry_path)
+        if image is None:
+            image = read_image(path, extension or os.path.splitext(path)[1])
+            image.load()
+            if image.mode not in ("P", "PA") and "transparency" not in image.info:
+                header = DISK_CACHE_HEADER_STRUCT.pack(DISK_CACHE_MAGIC, DISK_CACHE_VERSION, image.mode.encode("ascii"), *image.size)
+                self.store_entry(entry_path, header + image.tobytes())
+        return image
+
+    # Image scaled down to fit in max_size x max_size, keeping its aspect ratio
+    def read_thumbnail(self, path: str, max_size: int = 256) -> Image.Image:
+        entry_path = self.get_entry_path(self.get_hash(path), f"_{max_size}.png")
+        try:
+            with open(entry_path, "rb") as file:
+                image = Image.open(file)
+                image.load()
+            self.touch(entry_path)
+            return image
+        except FileNotFoundError:
+            pass
+        image = self.read(path)
+        image.thumbnail((max_size, max_size))
+        data = io.BytesIO()
+        image.save(data, "PNG")
+        self.store_entry(entry_path, data.getvalue())
+        return image
+
+    def load_entry(self, entry_path: str) -> Optional[Image.Image]:
+        try:
+            with open(entry_path, "rb") as file:
+                header = file.read(DISK_CACHE_HEADER_STRUCT.size)
+                data = file.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        try:
+            magic, version, mode, width, height = DISK_CACHE_HEADER_STRUCT.unpack(header)
+            if magic != DISK_CACHE_MAGIC or version != DISK_CACHE_VERSION:
+                raise ValueError("Unknown cache entry format")
+            image = Image.frombytes(mode.rstrip(b"\0").decode("ascii"), (width, height), data)
+        except Exception:
+            # A damaged or outdated entry is decoded again
+            self.remove_entry(entry_path)
+            self.misses += 1
+            return None
+        self.touch(entry_path)
+        self.hits += 1
+        return image
+
+    def store_entry(self, entry_path: str, data: bytes) -> None:
+        write_file_atomic(entry_path, data)
+        with self._lock:
+            self.total_bytes += len(data)
+            over_budget = self.max_bytes is not None and self.total_bytes > self.max_bytes
+        if over_budget:
+            self.cleanup()
+
+    # The modification time records when an entry was last used
+    def touch(self, entry_path: str) -> None:
+        try:
+            os.utime(entry_path)
+        except OSError:
+            pass
+
+    def remove_entry(self, entry_path: str) -> None:
+        try:
+            size = os.path.getsize(entry_path)
+            os.remove(entry_path)
+        except OSError:
+            return
+        with self._lock:
+            self.total_bytes -= size
+
+    # (path, last use, size) of every entry
+    def list_files(self) -> list[tuple[str, float, int]]:
+        result = []
+        for dirpath, _, filenames in os.walk(self.folder):
+            for filename in filenames:
+                if filename == DISK_CACHE_INDEX or filename.endswith(".tmp"):
+                    continue
+                entry_path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(entry_path)
+                except OSError:
+                    continue
+                result.append((entry_path, stat.st_mtime, stat.st_size))
+        return result
+
+    # Remove expired entries, then the least recently used ones until within budget
+    # Index records of files that no longer exist are dropped too. Returns the number of bytes removed
+    def cleanup(self) -> int:
+        files = sorted(self.list_files(), key=lambda entry: entry[1])
+        total = sum(size for _, _, size in files)
+        removed = 0
+        now = time.time()
+        for entry_path, last_use, size in files:
+            expired = self.max_age is not None and now - last_use > self.max_age
+            if not expired and (self.max_bytes is None or total - removed <= self.max_bytes):
+                break
+            self.remove_entry(entry_path)
+            removed += size
+        with self._lock:
+            self.total_bytes = total - removed
+            stale = [path for path in self._index if not os.path.isfile(path)]
+            for path in stale:
+                del self._index[path]
+        if stale or self._index_dirty:
+            self.save_index()
+        return removed
+
+    def clear(self) -> None:
+        for entry_path, _, _ in self.list_files():
+            self.remove_entry(entry_path)
+        with self._lock:
+            self._index = {}
+            self.total_bytes = 0
+        self.save_index()
+
+# Shared by everything in source.model. Set max_bytes to change the budget (0 turns caching off)
+DEFAULT_TEXTURE_CACHE = TextureCache(max_bytes=512 << 20)
+
+# Pass copy=False to share the cached image instead, if it is never modified
+def read_cached_image(path: str, extension: Optional[str] = None, copy: bool = True) -> Image.Image:
+    return DEFAULT_TEXTURE_CACHE.read(path, extension, copy)
+
+# Keep decoded textures on disk between runs, behind the shared in-memory cache
+def enable_disk_cache(folder: Optional[str] = None, max_bytes: Optional[int] = 2 << 30, max_age: Optional[float] = None) -> DiskTextureCache:
+    DEFAULT_TEXTURE_CACHE.disk_cache = DiskTextureCache(folder or get_default_cache_folder(), max_bytes, max_age)
+    return DEFAULT_TEXTURE_CACHE.disk_cache
+
+def read_thumbnail(path: str, max_size: int = 256) -> Image.Image:
+    if DEFAULT_TEXTURE_CACHE.disk_cache is None:
+        image = read_cached_image(path)
+        image.thumbnail((max_size, max_size))
+        return image
+    return DEFAULT_TEXTURE_CACHE.disk_cache.read_thumbnail(path, max_size)
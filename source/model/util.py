@@ -1,5 +1,6 @@
 from source.model.ganim_format import *
-from PIL import Image, ImageDraw
+from source.model.crop_cache import CropBox, get_uv_box, get_uv_rect, get_material_size
+from PIL import Image, ImageDraw, ImageFont
 
 colors = [
     (255, 0, 0),
@@ -10,20 +11,66 @@ colors = [
     (0, 255, 255),
 ]
 
-def overlay_atlas(anim: Animation) -> None:
-    # Set of tuples: (index, x1, y1, x2, y2)
-    seen_box: set[tuple[int, int, int, int, int]] = set()
-    if not anim.build:
-        return
-    for symbol in anim.build.symbols:
+def get_symbol_name(build: BuildFile, symbol: BuildSymbol) -> str:
+    try:
+        return build.get_hash_string(symbol.symbol_hash.hash_val)
+    except KeyError:
+        return to_hex(symbol.symbol_hash.hash_val)
+
+# Every distinct region of a material used by the build's frames, with the name of the first frame using it (like "body-0")
+def get_atlas_boxes(build: BuildFile, image_index: int) -> dict[CropBox, str]:
+    size = get_material_size(build.materials[image_index])
+    boxes: dict[CropBox, str] = {}
+    if size is None:
+        return boxes
+    for symbol in build.symbols:
+        name = None
         for frame in symbol.frames:
-            material = anim.build.materials[frame.image_index]
-            if material.image is not None:
-                mat_w, mat_h = material.image.size
-                x1, y1 = round(mat_w * frame.uv0.x), round(mat_h * frame.uv0.y)
-                x2, y2 = round(mat_w * frame.uv1.x), round(mat_h * frame.uv1.y)
-                id = (frame.image_index, x1, y1, x2, y2)
-                if id not in seen_box:
-                    mask = Image.new("L", (x2 - x1, y2 - y1), 50)
-                    material.image.paste(colors[len(seen_box) % len(colors)], (x1, y1, x2, y2), mask)
-                    seen_box.add(id)
+            if frame.image_index != image_index:
+                continue
+            box = get_uv_box(get_uv_rect(frame), size)
+            if box[2] > box[0] and box[3] > box[1] and box not in boxes:
+                name = name or get_symbol_name(build, symbol)
+                boxes[box] = f"{name}-{frame.frame_num}"
+    return boxes
+
+# Layer the size of a material showing where every frame of the build is in it, to draw over the material
+# Boxes are filled with translucent colours (opacity from 0 to 255), or only outlined. Labels are cut to fit their box
+def make_atlas_overlay(build: BuildFile, image_index: int, outline: bool = False, labels: bool = True, opacity: int = 50) -> Optional[Image.Image]:
+    size = get_material_size(build.materials[image_index])
+    if size is None:
+        return None
+    layer = Image.new("RGBA", size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(layer)
+    # The bitmap font draws thousands of labels much faster than FreeType (Pillow before 10.1 only has that one)
+    font = getattr(ImageFont, "load_default_imagefont", ImageFont.load_default)()
+    # Labels are cut by an estimate of their width, as measuring each one is slower than drawing it
+    # getmask measures bitmap fonts in every Pillow version (getlength and getbbox need 9.2)
+    width, height = font.getmask("Mg").size
+    char_width = max(1, width // 2)
+    line_height = height + 2
+    for i, (box, label) in enumerate(get_atlas_boxes(build, image_index).items()):
+        color = colors[i % len(colors)]
+        x1, y1, x2, y2 = box
+        if outline:
+            draw.rectangle((x1, y1, x2 - 1, y2 - 1), outline=color + (255,))
+        else:
+            draw.rectangle((x1, y1, x2 - 1, y2 - 1), fill=color + (opacity,))
+        max_chars = (x2 - x1 - 2) // char_width
+        if labels and max_chars > 0 and y2 - y1 >= line_height:
+            draw.text((x1 + 1, y1 + 1), label[:max_chars], fill=color + (255,), font=font)
+    return layer
+
+# Copies of the build's materials with their overlays drawn over them. The materials themselves are left untouched
+def overlay_atlas(anim: Animation, outline: bool = False, labels: bool = True, opacity: int = 50) -> list[Optional[Image.Image]]:
+    if not anim.build:
+        return []
+    result: list[Optional[Image.Image]] = []
+    for image_index, material in enumerate(anim.build.materials):
+        layer = make_atlas_overlay(anim.build, image_index, outline, labels, opacity)
+        if layer is None or material.image is None:
+            result.append(None)
+            continue
+        image = material.image if material.image.mode == "RGBA" else material.image.convert("RGBA")
+        result.append(Image.alpha_composite(image, layer))
+    return result
@@ -109,8 +109,8 @@ class AnimEditor(tk.Toplevel):
         if self.loaded_project is None:
             return
         try:
-            filename = filedialog.asksaveasfilename(filetypes=[("Project File", ".json")], initialfile=self.project_path and os.path.basename(self.project_path))
-            if not filename.endswith(".json"):
+            filename = filedialog.asksaveasfilename(filetypes=[("Project File", [".gaproj", ".json"]), ("Binary Project File", ".gaproj"), ("JSON Project File", ".json")], initialfile=self.project_path and os.path.basename(self.project_path))
+            if not filename.endswith(".json") and not filename.endswith(".gaproj"):
                 filename += ".json"
             # print(filename)
             if filename:
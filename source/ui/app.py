@@ -5,6 +5,7 @@ import traceback
 
 from source.model.anim_project import get_test_project
 from source.model.anim_project_io import load_project
+from source.model.texture_cache import enable_disk_cache
 from source.ui.anim_editor import AnimEditor
 from source.ui.image_editor import ImageEditor
 
@@ -29,14 +30,20 @@ class App(tk.Frame):
 
     def open_project(self) -> None:
         try:
-            filename = filedialog.askopenfilename(filetypes=[("Project File", ".json")])
+            filename = filedialog.askopenfilename(filetypes=[("Project File", [".gaproj", ".json"]), ("Binary Project File", ".gaproj"), ("JSON Project File", ".json")])
             # print(filename)
             if filename:
-                AnimEditor(load_project(filename), self.master)
+                AnimEditor(load_project(filename, preload=True), self.master)
         except Exception as e:
             traceback.print_exception(e)
             messagebox.showerror("Error while reading file", f"{type(e).__name__}: {e}")
 def run():
+    try:
+        enable_disk_cache()
+    except OSError as e:
+        # Textures are still decoded, just not cached between runs
+        traceback.print_exception(e)
+
     root = tk.Tk()
     root.title("Griftlands Animation Explorer")
 
@@ -4,7 +4,8 @@ from typing import Optional
 from PIL import Image, ImageTk
 import os, traceback
 
-from source.model.image_format import read_image, write_image
+from source.model.image_format import write_image
+from source.model.texture_cache import read_cached_image
 from source.ui.scrollable_canvas import ScrollableCanvas
 from source.ui.constants import *
 
@@ -39,7 +40,7 @@ class ImageEditor(tk.Toplevel):
             filename = filedialog.askopenfilename(filetypes=[("Any Image File", [".png", ".tex", ".dds"]), ("PNG File", ".png"), ("Klei Tex File", ".tex"), ("DDS File", ".dds")], initialdir=self.image_name and os.path.dirname(self.image_name))
             # print(filename)
             if filename:
-                self.update_image(read_image(filename), filename)
+                self.update_image(read_cached_image(filename, copy=False), filename)
         except Exception as e:
             traceback.print_exception(e)
             messagebox.showerror("Error while reading file", f"{type(e).__name__}: {e}")
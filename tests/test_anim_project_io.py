@@ -0,0 +1,41 @@
+from PIL import Image
+
+from source.model.anim_project import AnimProject, Atlas, IntCoord
+from source.model.anim_project_io import save_project, load_project
+
+def make_project() -> AnimProject:
+    project = AnimProject()
+    project.register_object(project.atlas)
+    project.atlas.name = "root.png"
+    project.atlas.size = IntCoord(8, 8)
+    project.atlas.source = Image.new("RGBA", (8, 8), (0, 0, 0, 255))
+    child = project.atlas.add_child(Atlas(name="atlas.png", size=IntCoord(4, 4)))
+    child.source = Image.new("RGBA", (4, 4), (10, 20, 30, 255))
+    return project
+
+def find_atlas(project: AnimProject, name: str) -> Atlas:
+    return next(atlas for atlas in project.get_atlases() if atlas.name == name)
+
+def test_rename_atlas_to_other_format(tmp_path):
+    file = str(tmp_path / "project.json")
+    save_project(file, make_project())
+    # The source is read back from atlas.png unedited, and saved under a name in another format
+    project = load_project(file)
+    find_atlas(project, "atlas.png").name = "atlas.tex"
+    save_project(file, project)
+    with open(tmp_path / "project_assets" / "atlas.tex", "rb") as asset_file:
+        assert asset_file.read(4) == b"KTEX"
+    loaded = find_atlas(load_project(file), "atlas.tex")
+    assert loaded.source.size == (4, 4)
+    assert loaded.source.convert("RGBA").getpixel((0, 0)) == (10, 20, 30, 255)
+
+def test_rename_atlas_same_format_copies_file(tmp_path):
+    file = str(tmp_path / "project.json")
+    save_project(file, make_project())
+    with open(tmp_path / "project_assets" / "atlas.png", "rb") as asset_file:
+        data = asset_file.read()
+    project = load_project(file)
+    find_atlas(project, "atlas.png").name = "renamed.png"
+    save_project(file, project)
+    with open(tmp_path / "project_assets" / "renamed.png", "rb") as asset_file:
+        assert asset_file.read() == data
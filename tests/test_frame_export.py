@@ -0,0 +1,26 @@
+import json, os
+
+from source.model.ganim_format import AnimData, AnimFrame, BuildFile, Coord
+from source.model.frame_export import export_frames, get_unique_name, FrameExportOptions
+
+def make_anim(name: str) -> AnimData:
+    anim = AnimData(anim_name=name)
+    anim.frames = [AnimFrame(Coord(0, 0), Coord(4, 4))]
+    return anim
+
+def test_get_unique_name():
+    used: set[str] = set()
+    assert get_unique_name("a/b", used) == "a_b"
+    assert get_unique_name("a:b", used) == "a_b_2"
+    assert get_unique_name("A_B", used) == "A_B_3"
+    assert get_unique_name("c", used) == "c"
+
+def test_export_frames_colliding_names(tmp_path):
+    anims = [make_anim("a/b"), make_anim("a:b")]
+    for layout in ("sequence", "sheet"):
+        output_folder = str(tmp_path / layout)
+        files = export_frames(BuildFile(), anims, output_folder, FrameExportOptions(layout=layout), jobs=1)
+        assert len(set(files)) == len(files)
+        assert all(os.path.isfile(file) for file in files)
+    with open(tmp_path / "sheet" / "a_b_2.json") as info_file:
+        assert json.load(info_file)["anim_name"] == "a:b"
@@ -0,0 +1,26 @@
+from source.model.ganim_format import BuildFile, BuildFrame, BuildSymbol, HashRef
+
+def make_build() -> BuildFile:
+    # Frames 2-3 and 6, with a gap at 4-5
+    symbol = BuildSymbol(HashRef(1), frames=[BuildFrame(6, 1), BuildFrame(2, 2)])
+    return BuildFile(symbols=[symbol])
+
+def test_get_symbol_frame_covered():
+    build = make_build()
+    assert build.get_symbol_frame(1, 2).frame_num == 2
+    assert build.get_symbol_frame(1, 3).frame_num == 2
+    assert build.get_symbol_frame(1, 6).frame_num == 6
+
+def test_get_symbol_frame_gap():
+    build = make_build()
+    assert build.get_symbol_frame(1, 4) is None
+    assert build.get_symbol_frame(1, 5) is None
+    assert build.get_symbol_frame(1, 7) is None
+
+def test_get_symbol_frame_before_first_frame():
+    build = make_build()
+    assert build.get_symbol_frame(1, 0) is None
+    assert build.get_symbol_frame(1, 1) is None
+
+def test_get_symbol_frame_unknown_symbol():
+    assert make_build().get_symbol_frame(2, 2) is None